@@ -25,3 +25,33 @@ admin.site.register(Report)
 from .models import Extracted
 
 admin.site.register(Extracted)
+
+# register Page
+from .models import Page
+
+admin.site.register(Page)
+
+# register Table
+from .models import Table
+
+admin.site.register(Table)
+
+# register LayoutTemplate
+from .models import LayoutTemplate
+
+admin.site.register(LayoutTemplate)
+
+# register PageCache
+from .models import PageCache
+
+admin.site.register(PageCache)
+
+# register Blob
+from .models import Blob
+
+admin.site.register(Blob)
+
+# register Job
+from .models import Job
+
+admin.site.register(Job)
@@ -0,0 +1,82 @@
+"""
+extraction_worker.py
+    version: 1.0
+
+Logic:
+    Extraction worker, drains the database backed extraction queue:
+
+        python manage.py extraction_worker [--once] [--poll SECONDS]
+
+    Uploads only store their document and queue a Job (api/upload/ returns
+    202 with the job id). The worker claims the oldest queued job and runs
+    its extraction (api/scripts/job_queue.py), several workers can drain the
+    same queue without running a job twice. Running jobs of workers that
+    stopped sending heartbeats are requeued before every claim.
+
+    While the queue is empty the worker checks it again every
+    EXTRACTION_QUEUE_POLL seconds, --once exits instead. Jobs share the
+    worker's warm extraction pool (worker_pool.py), stopped when it exits.
+
+Returns:
+    [None]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.scripts import job_queue, worker_pool
+from api.scripts.logging import Logging
+
+
+# default seconds between queue checks while idle
+POLL = 2
+
+
+class Command(BaseCommand):
+    help = "Run queued extraction jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="exit once the queue is empty"
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=getattr(settings, "EXTRACTION_QUEUE_POLL", POLL),
+            help="seconds between queue checks while idle",
+        )
+
+    def handle(self, *args, **options):
+        log = Logging()
+
+        worker = job_queue.worker_name()
+        log.output("INFO", f"extraction worker {worker} started")
+
+        try:
+            while True:
+                # jobs of workers that were killed mid job
+                job_queue.recover()
+
+                job = job_queue.claim(worker)
+
+                if job is not None:
+                    job_queue.run_job(job)
+                    continue
+
+                if options["once"]:
+                    break
+
+                # do not hold the database connection while idle
+                connection.close()
+                time.sleep(options["poll"])
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            worker_pool.shutdown()
+
+        log.output("INFO", f"extraction worker {worker} stopped")
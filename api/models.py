@@ -21,6 +21,7 @@ import re
 
 from pathlib import PurePath
 from django.core.files.storage import FileSystemStorage
+from django_cleanup import cleanup
 
 
 class MyStorage(FileSystemStorage):
@@ -76,13 +77,46 @@ class Report(models.Model):
     Report database Class Model
     """
 
+    # table parser used for detected table areas
+    PARSER_CHOICES = (
+        ("camelot", "Camelot"),
+        ("stream", "Stream"),
+        ("lattice", "Lattice"),
+        ("auto", "Auto"),
+    )
+
+    # table detector, 'text+yolo' runs Yolov3 only on pages where the text
+    # detector finds no valid tables
+    DETECTOR_CHOICES = (
+        ("yolo", "Yolov3"),
+        ("text", "Text geometry"),
+        ("text+yolo", "Text geometry, then Yolov3"),
+    )
+
+    # report level exports, one output per document next to the per table files
+    EXPORT_CHOICES = (("parquet", "Parquet"), ("ndjson", "NDJSON"), ("xlsx", "XLSX"))
+
     name = models.CharField(max_length=100, null=True)
     document = models.FileField(storage=MyStorage(), upload_to=upload_path)
-    zip_csv = models.FileField(null=True)
+    ndjson = models.FileField(null=True, blank=True)
+    xlsx = models.FileField(null=True, blank=True)
+    # parquet dataset directory, one part file per page with tables
+    parquet = models.CharField(max_length=255, blank=True, default="")
+    # pages with a part file in the parquet dataset, recorded as it is written
+    parquet_pages = models.JSONField(default=list, blank=True)
     f_type = models.CharField(max_length=5, null=True)
     total_pages = models.PositiveIntegerField(null=True, blank=True)
     start_page = models.IntegerField(default=1)
     end_page = models.IntegerField(default=-1)
+    parser = models.CharField(max_length=10, default="camelot", choices=PARSER_CHOICES)
+    detector = models.CharField(max_length=10, default="yolo", choices=DETECTOR_CHOICES)
+    exports = models.CharField(max_length=50, blank=True, default="")
+
+    # aggregates maintained once per extraction or re-parse job
+    tables_found = models.PositiveIntegerField(default=0)
+    pages_with_tables = models.PositiveIntegerField(default=0)
+    pages_processed = models.PositiveIntegerField(default=0)
+    processing_seconds = models.FloatField(default=0)
 
     # returns file name without .extension
     def filename(self):
@@ -91,6 +125,12 @@ class Report(models.Model):
         """
         return os.path.splitext(self.document.name)[0]
 
+    def export_types(self):
+        """
+        Returns selected report level exports as a list
+        """
+        return [e.strip() for e in self.exports.split(",") if e.strip()]
+
     def __unicode__(self):
         return "%s" % (self.document)
 
@@ -106,6 +146,195 @@ class Report(models.Model):
         )
 
 
+class Page(models.Model):
+    """
+    Page database Class Model, processing result of an extracted page
+    """
+
+    STATUS_CHOICES = (("ok", "OK"), ("timed out", "Timed out"), ("failed", "Failed"))
+
+    report = models.ForeignKey(
+        Report,
+        related_name="pages",
+        on_delete=models.CASCADE,
+    )
+    page_num = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, default="ok", choices=STATUS_CHOICES)
+    # where the page's table regions came from, eg. 'yolo' or 'template'
+    detector = models.CharField(max_length=10, null=True, blank=True)
+    # valid tables, seconds per stage ('detect', 'parse', 'store') and in total
+    tables = models.PositiveIntegerField(default=0)
+    timings = models.JSONField(default=dict, blank=True)
+    seconds = models.FloatField(default=0)
+    # last status change, progress events are sent for pages changed since
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s %s %s" % (self.page_num, self.status, self.detector)
+
+    class Meta:
+        ordering = ["page_num"]
+        unique_together = ["report", "page_num"]
+
+
+class Job(models.Model):
+    """
+    Job database Class Model, an upload's extraction or a report's re-parse
+    queued for the extraction worker (python manage.py extraction_worker)
+    """
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    # extraction of an upload, or a re-parse of its stored detections
+    KIND_CHOICES = (("extract", "Extract"), ("reparse", "Re-parse"))
+
+    # kept when a failed extraction removes its report
+    report = models.ForeignKey(
+        Report,
+        related_name="jobs",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    status = models.CharField(max_length=10, default="queued", choices=STATUS_CHOICES)
+    kind = models.CharField(max_length=10, default="extract", choices=KIND_CHOICES)
+    # parser of a re-parse job
+    parser = models.CharField(
+        max_length=10, null=True, blank=True, choices=Report.PARSER_CHOICES
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # host:pid of the worker that claimed the job
+    worker = models.CharField(max_length=100, blank=True, default="")
+    # refreshed by the worker while the job runs, running jobs whose
+    # heartbeat stopped are requeued or failed (see job_queue.py)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # extraction response once done, error message once failed
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return "%s %s %s" % (self.id, self.report_id, self.status)
+
+    class Meta:
+        ordering = ["created"]
+
+
+class Table(models.Model):
+    """
+    Table database Class Model, a detected table region and its parsing metadata
+    """
+
+    report = models.ForeignKey(
+        Report,
+        related_name="tables",
+        on_delete=models.CASCADE,
+    )
+    page_num = models.PositiveIntegerField()
+    # set when the parsed region passed validation and was exported
+    table_num = models.PositiveIntegerField(null=True, blank=True)
+
+    # x1,y1,x2,y2 where (x1, y1) -> left-top and (x2, y2) -> right-bottom in PDF coordinate space
+    x1 = models.FloatField()
+    y1 = models.FloatField()
+    x2 = models.FloatField()
+    y2 = models.FloatField()
+    confidence = models.FloatField(null=True, blank=True)
+
+    parser = models.CharField(
+        max_length=10, null=True, blank=True, choices=Report.PARSER_CHOICES
+    )
+    parsing_report = models.JSONField(null=True, blank=True)
+    # cell matrix of small exported tables, larger ones are in a canonical file
+    cells = models.JSONField(null=True, blank=True)
+    # blob digest of an exported table, its canonical file when not inline
+    digest = models.CharField(max_length=64, null=True, blank=True)
+
+    def area(self):
+        """
+        Returns region as a camelot table_areas string
+        """
+        return ",".join(str(v) for v in (self.x1, self.y1, self.x2, self.y2))
+
+    def __str__(self):
+        return "%s %s %s %s" % (self.page_num, self.table_num, self.area(), self.confidence)
+
+    class Meta:
+        ordering = ["page_num", "id"]
+
+
+class LayoutTemplate(models.Model):
+    """
+    LayoutTemplate database Class Model, a page layout fingerprint and the
+    table regions confirmed on pages with that layout
+    """
+
+    key = models.CharField(max_length=40, unique=True)
+    # page size and top grid rows, candidate templates of a page are looked up by it
+    header = models.CharField(max_length=40, db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    # text block occupancy grid, row major string of 0/1
+    bits = models.CharField(max_length=192)
+    # x1,y1,x2,y2 where (x1, y1) -> left-top and (x2, y2) -> right-bottom in PDF coordinate space
+    regions = models.JSONField()
+    # per region, x positions the text lines of its table's columns start at
+    columns = models.JSONField(default=list)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s %sx%s %s %s" % (
+            self.key,
+            self.width,
+            self.height,
+            len(self.regions),
+            self.hits,
+        )
+
+
+class PageCache(models.Model):
+    """
+    PageCache database Class Model, extracted tables of a page stored under
+    the hash of its content, shared by every document containing that page
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    # per region: region, confidence, parsing_report, table_num and cell values
+    tables = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s %s %s" % (self.key, len(self.tables), self.hits)
+
+
+class Blob(models.Model):
+    """
+    Blob database Class Model, a table stored once in the shared blob store
+    under the hash of its cells, referenced by every extraction of that table
+    """
+
+    digest = models.CharField(max_length=64, unique=True)
+    # bytes of the compact json cell matrix
+    size = models.PositiveIntegerField()
+    # Extracted instances linked to the blob, its files are removed at 0
+    refs = models.PositiveIntegerField(default=0)
+    # last time a worker relied on the stored files before its job linked
+    # them, kept at 0 refs until the reservation expires
+    reserved = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "%s %s %s" % (self.digest, self.size, self.refs)
+
+
+# files are shared blob outputs, removed by the blob store with the last reference
+@cleanup.ignore
 class Extracted(models.Model):
     """
     Extracted database Class Model
@@ -123,6 +352,20 @@ class Extracted(models.Model):
         blank=True,
         on_delete=models.CASCADE,
     )
+    table = models.ForeignKey(
+        Table,
+        related_name="extracted",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    blob = models.ForeignKey(
+        Blob,
+        related_name="extracted",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
     page_num = models.PositiveIntegerField(
         null=True,
         blank=True,
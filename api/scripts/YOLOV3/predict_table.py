@@ -23,24 +23,32 @@ Returns:
 
 # %%
 import django
-from pathlib import Path, PurePath
+from pathlib import Path
 import os
 
 # get django app
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
 django.setup()
 
+from django.conf import settings
+from django.db import transaction
+
 # import database
-from api.models import Extracted
+from api.models import Extracted, Page, Table
+from api import signals
 from api.serializers import *
 from api.scripts.logging import Logging
 
 import sys
 import copy
+import signal
+import functools
 import datetime as date
 from camelot import io as camelot
 
 from time import sleep
+from timeit import default_timer as timer
+from contextlib import contextmanager
 
 import numpy as np
 import pandas as pd
@@ -51,10 +59,69 @@ import matplotlib.image as mpimg
 
 from PyPDF2 import PdfFileWriter, PdfFileReader
 from pdf2image import convert_from_path, convert_from_bytes
-from api.scripts.YOLOV3.utils.detect_func import detectTable, parameters
+from api.scripts.YOLOV3.utils.detect_func import (
+    detectTable,
+    parameters,
+    TINY_MODEL,
+    FULL_MODEL,
+)
+from api.scripts import stream_parser, lattice_parser, regions, layout_cache, page_cache
+from api.scripts import text_detector, table_store, blob_store, write_behind
 
 
 # %%
+class PageTimeoutError(Exception):
+    """
+    raised inside a worker when a page runs over its time budget
+    """
+
+
+@contextmanager
+def page_budget(seconds):
+    """
+    raise PageTimeoutError in the running worker once seconds have passed,
+    no budget when seconds is None or SIGALRM is not available (Windows)
+    """
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def handler(signum, frame):
+        raise PageTimeoutError(f"page over {seconds}s budget")
+
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+# seconds spent per stage of the page being run, reset by run_page()
+stage_seconds = {}
+
+
+def timed_stage(name):
+    """
+    decorator, adds the run time of the decorated function to a page stage
+    ('detect', 'parse' or 'store') reported with the page's status
+    """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage_seconds[name] = stage_seconds.get(name, 0) + timer() - start
+
+        return wrapper
+
+    return decorate
+
+
 def norm_pdf_page(pdf_file, pg):
     pdf_doc = PdfFileReader(open(pdf_file, "rb"), strict=False)
     pdf_page = pdf_doc.getPage(pg - 1)
@@ -89,6 +156,13 @@ def outpout_yolo(output):
     return bboxes
 
 
+def pdf_page_size(pdf_page):
+    W_pdf = float(pdf_page.cropBox.getLowerRight()[0])
+    H_pdf = float(pdf_page.cropBox.getUpperLeft()[1])
+
+    return (W_pdf, H_pdf)
+
+
 def img_dim(img, bbox):
     H_img, W_img, _ = img.shape
     x1_img, y1_img, x2_img, y2_img, _, _ = bbox
@@ -140,6 +214,56 @@ def bboxes_pdf(img, pdf_page, bbox, save_cropped=False):
     return [x1, y1, x2, y2]
 
 
+def parse_areas(pdf_file, pg, interesting_areas, parser, img, pdf_page, glyphs=None) -> list:
+    """
+    parse table areas on a page with the selected parser
+    'camelot': camelot in 'stream' flavour
+               camelot >= v0.10.0: backend= 'poppler' or 'ghostscript'
+    'stream':  native numpy stream parser, see api/scripts/stream_parser.py
+    'lattice': ruling line parser on the already rendered page image,
+               see api/scripts/lattice_parser.py
+    'auto':    lattice for areas with a ruling grid, native stream otherwise,
+               pages without a rendered image (template cache hits) use stream
+    the native parsers reuse the page glyphs when the text detector read them
+
+    returns list of parsed tables exposing .df and .parsing_report
+    """
+    if not interesting_areas:
+        return []
+
+    if img is None and parser == "auto":
+        parser = "stream"
+    elif img is None and parser == "lattice":
+        img = pdf_page2img(pdf_file, pg, save_image=False)
+
+    if parser == "stream":
+        return stream_parser.read_pdf(
+            filepath=pdf_file,
+            pages=str(pg),
+            table_areas=interesting_areas,
+            glyphs=glyphs,
+        )
+
+    if parser in ("lattice", "auto"):
+        return lattice_parser.read_pdf(
+            filepath=pdf_file,
+            pages=str(pg),
+            table_areas=interesting_areas,
+            img=img,
+            page_size=pdf_page_size(pdf_page),
+            auto=parser == "auto",
+            glyphs=glyphs,
+        )
+
+    return camelot.read_pdf(
+        filepath=pdf_file,
+        pages=str(pg),
+        flavor="stream",
+        table_areas=interesting_areas,
+        backend="poppler",
+    )
+
+
 def tableValidate(dataframe) -> bool:
     """
     validation function for evaluating extracted tables
@@ -157,28 +281,22 @@ def tableValidate(dataframe) -> bool:
 # %%
 
 
-def detect_tables(file_path, page_number, output_type, report_db, extract_dir) -> list:
+@timed_stage("detect")
+def detect_regions(pdf_file, pg) -> tuple:
     """
-    Main function for detection, extraction, and saving extracted tables to database
-    """
-    # create log object
-    log = Logging()
-
-    # log.output('INFO', f'processing page {page_number}')
-
-    # previous code; left as many references to them...
-    pdf_file = file_path
-    pg = page_number
+    detection stage, renders the page and runs Yolov3 inferencing and region
+    post-processing
 
+    returns page image, normalised pdf page, (N, 4) regions, confidences and
+    the model stage ('tiny' or 'full') the regions came from
+    """
     # image conversion
     img_path = pdf_file[:-4] + "-" + str(pg) + ".jpg"
     pdf_page = norm_pdf_page(pdf_file, pg)
     img = pdf_page2img(pdf_file, pg, save_image=True)
 
     # yolo inferencing
-    opt = parameters(img_path)
-    output_detect = detectTable(opt)
-    output = outpout_yolo(output_detect)
+    output, stage = cascade_detect(img_path)
 
     # remove unwanted files
     Path.unlink(Path(img_path))
@@ -207,80 +325,504 @@ def detect_tables(file_path, page_number, output_type, report_db, extract_dir) -
         plt.savefig(pdf_file[:-4] + "-" + str(pg) + ".png")
         plt.show()
 
-    interesting_areas = []
+    # collect coordinates for found objects, then merge overlapping and nested
+    # regions, clip them to the cropBox and drop slivers so each table is parsed once
+    # x1,y1,x2,y2 where (x1, y1) -> left-top and (x2, y2) -> right-bottom in PDF coordinate space
+    page_size = pdf_page_size(pdf_page)
+    found, scores = regions.postprocess(
+        regions.pdf_regions(output, img.shape, page_size),
+        page_size,
+        scores=[x[5] for x in output],
+    )
 
-    # collect coordinates for found objects
-    for x in output:
-        [x1, y1, x2, y2] = bboxes_pdf(img, pdf_page, x)
+    return img, pdf_page, found, scores, stage
 
-        # x1,y1,x2,y2 where (x1, y1) -> left-top and (x2, y2) -> right-bottom in PDF coordinate space
-        bbox_camelot = [",".join([str(x1), str(y1), str(x2), str(y2)])][0]
-        interesting_areas.append(bbox_camelot)
 
-    # call camelot on any interesting areas found by Yolov3
-    # camelot in 'stream' flavour; other option 'lattice'
-    # camelot >= v0.10.0: backend= 'poppler' or 'ghostscript'
-    output_camelot = camelot.read_pdf(
-        filepath=pdf_file,
-        pages=str(pg),
-        flavor="stream",
-        table_areas=interesting_areas,
-        backend="poppler",
+@timed_stage("detect")
+def text_regions(pdf_file, pg, text_page=None) -> tuple:
+    """
+    text geometry detection stage, finds table regions from the glyph boxes
+    of the page's text layer without rendering the page, text_page is the
+    page's pdfminer layout when already parsed
+
+    returns normalised pdf page, (N, 4) regions, confidences and page glyphs
+    """
+    pdf_page = norm_pdf_page(pdf_file, pg)
+    glyphs = stream_parser.page_glyphs(pdf_file, pg, text_page)
+
+    found, scores = text_detector.detect(*glyphs, pdf_page_size(pdf_page))
+
+    return pdf_page, found, scores, glyphs
+
+
+def cascade_detect(img_path) -> tuple:
+    """
+    tiny to full model detection cascade, the tiny model runs on every page
+    and only pages with a detection confidence inside EXTRACTION_CASCADE_BAND
+    are run again with the full model
+
+    returns list of yolo detections and the model stage used
+    """
+    band = getattr(settings, "EXTRACTION_CASCADE_BAND", None)
+
+    # no cascade without a band or the full model weights
+    if (
+        not getattr(settings, "EXTRACTION_CASCADE", False)
+        or band is None
+        or not Path(FULL_MODEL["weights"]).is_file()
+    ):
+        return outpout_yolo(detectTable(parameters(img_path))), "tiny"
+
+    low, high = band
+
+    # detections under the band are dropped, above it the tiny model is trusted
+    output = outpout_yolo(detectTable(parameters(img_path, TINY_MODEL, conf_thres=low)))
+
+    if not any(x[5] < high for x in output):
+        return output, "tiny"
+
+    return outpout_yolo(detectTable(parameters(img_path, FULL_MODEL))), "full"
+
+
+def page_regions(report_db, pg, found, scores) -> list:
+    """
+    detected regions as unsaved Table database instances, saved with the
+    page's tables through the write behind queue (see save_tables())
+
+    returns list of Table instances in region order
+    """
+    return [
+        Table(
+            report=report_db,
+            page_num=pg,
+            x1=x1,
+            y1=y1,
+            x2=x2,
+            y2=y2,
+            confidence=None if score is None else float(score),
+        )
+        for (x1, y1, x2, y2), score in zip(found.tolist(), scores)
+    ]
+
+
+@timed_stage("parse")
+def parse_tables(file_path, pg, tables, parser, img, pdf_page, glyphs=None) -> list:
+    """
+    parsing stage, parses the stored table regions of a page with the selected
+    parser and records parsing metadata on each region
+
+    returns list of camelot parsing reports, list of valid (Table, dataframe)
+    """
+    # create log object
+    log = Logging()
+
+    found = np.array([[t.x1, t.y1, t.x2, t.y2] for t in tables]).reshape(-1, 4)
+    interesting_areas = regions.table_areas(found)
+
+    # parse any interesting areas found by Yolov3 with the job's selected parser,
+    # lattice parsing reuses the page image rendered for detection
+    output_camelot = parse_areas(
+        file_path, pg, interesting_areas, parser, img, pdf_page, glyphs
     )
 
+    for table in tables:
+        table.parser = parser
+        table.table_num = None
+        table.parsing_report = None
+        table.cells = None
+        table.digest = None
+
     report = []
+    valid = []
 
     # log camelot parssing report to django terminal
+    matched = regions.match_regions(found, [x._bbox for x in output_camelot])
+
+    for parsed, idx in zip(output_camelot, matched):
+        log.output("DEBUG", f"table parsing_report: {parsed.parsing_report}")
+        report.append(parsed.parsing_report)
+        tables[idx].parsing_report = parsed.parsing_report
+
+        # get camelot dataframes, added tableValidate() check
+        if tableValidate(parsed.df):
+            tables[idx].table_num = len(valid)
+
+            # clean dataframe, replace NaN's with empty string
+            valid.append((tables[idx], parsed.df.fillna("")))
+
+    return report, valid
+
+
+def restore_tables(file_path, pg, cached, parser, report_db) -> tuple:
+    """
+    recreate a page's regions and tables from a page cache entry, without
+    rendering, detection or parsing
+
+    returns list of unsaved Table instances, list of stored camelot parsing
+    reports, list of valid (Table, dataframe)
+    """
+    tables = []
+    valid = []
+
+    for entry in cached.tables:
+        x1, y1, x2, y2 = entry["region"]
+        table = Table(
+            report=report_db,
+            page_num=pg,
+            table_num=entry["table_num"],
+            x1=x1,
+            y1=y1,
+            x2=x2,
+            y2=y2,
+            confidence=entry["confidence"],
+            parser=parser,
+            parsing_report=entry["parsing_report"],
+        )
+        tables.append(table)
+
+        if entry["cells"] is not None:
+            valid.append((table, pd.DataFrame(entry["cells"])))
+
+    report = [t.parsing_report for t in tables if t.parsing_report is not None]
+
+    return tables, report, valid
+
+
+def page_tables(report_db, valid) -> list:
+    """
+    cells of a page's valid tables for the report level exporters, empty when
+    the report has no report level exports
+
+    returns list of {"table": table number, "region": [x1, y1, x2, y2],
+    "parsing_report": parsing report, "df": dataframe}
+    """
+    if not report_db.export_types():
+        return []
+
+    return [
+        {
+            "table": table.table_num,
+            "region": [table.x1, table.y1, table.x2, table.y2],
+            "parsing_report": table.parsing_report,
+            "df": df,
+        }
+        for table, df in valid
+    ]
+
+
+def store_table(db, key: str, size: int) -> None:
+    """
+    store a valid table too large to be inline once in its canonical form in
+    the shared blob store, tables already stored by any report are not
+    written again
+    """
+    # the blob is reserved before its canonical file is relied on, until
+    # the coordinator links this job's extractions (see blob_store.py)
+    blob_store.reserve(key, size)
+    if not table_store.canonical_path(key).exists():
+        table_store.write(table_store.canonical_path(key), db)
+
+    return None
+
+
+def save_tables(report_db, pg, tables) -> None:
+    """
+    replace the Table instances of a page with its current regions and
+    tables in one bulk insert, re-parsed Table instances keep their ids
+    """
+    with transaction.atomic():
+        Table.objects.filter(report=report_db, page_num=pg).delete()
+        Table.objects.bulk_create(tables)
+
+    return None
+
+
+@timed_stage("store")
+def export_tables(report_db, pg, tables, valid) -> list:
+    """
+    store a page's regions and valid tables through the worker's write behind
+    queue (see api/scripts/write_behind.py) and describe their outputs, the
+    coordinator saves the Extracted instances of all pages at the end of the
+    job (see table_extract.save_extracted()). The output files are only
+    generated when first requested (see api/scripts/table_store.py)
+
+    returns list of {"page": page number, "table_num": table number,
+    "digest": blob digest, "size": cell bytes}
+    """
+    outputs = []
+
+    for table, db in valid:
+        # log.output('SUCCESS', f'found table: page {pg}, table {table.table_num}')
+        encoded = blob_store.encode(table_store.cell_matrix(db))
+        key = blob_store.digest(encoded)
+
+        # small tables are stored inline on their Table
+        table.cells = table_store.inline_cells(db)
+        table.digest = key
+        if table.cells is None:
+            write_behind.submit(pg, store_table, db, key, len(encoded))
+
+        outputs.append(
+            {
+                "page": pg,
+                "table_num": table.table_num,
+                "digest": key,
+                "size": len(encoded),
+            }
+        )
+
+    # saved once the canonical files are in place, readers go by the digest
+    write_behind.submit(pg, save_tables, report_db, pg, tables)
+
+    return outputs
+
+
+def detect_tables(file_path, page_number, output_type, report_db, extract_dir) -> dict:
+    """
+    Main function for detection, extraction, and saving extracted tables to database
+
+    returns dict of camelot parsing reports, the detector and yolo model stage
+    used and the page's tables for report level exports
+    """
+    # log.output('INFO', f'processing page {page_number}')
 
-    for table in output_camelot:
-        log.output("DEBUG", f"table parsing_report: {table.parsing_report}")
-        report.append(table.parsing_report)
-
-    # get camelot dataframes, added tableValidate() check
-    output_camelot = [x.df for x in output_camelot if tableValidate(x.df)]
-
-    # clean dataframe
-    for table in output_camelot:
-        # replace NaN's with empty string
-        table = table.fillna("")
-
-    # get pdf filename
-    filename = Path(file_path).name
-
-    # export and save to database
-    # Note1:    CSV,EXCEL: optional arg 'index=[Bool]'
-    #           if you wish to exclude the y indexing, set index=False (default is True)
-    #
-    # Note2:    Can format the JSON Export structure with optional arg 'orient=[String]'
-    #           choices: split, records, index, values, table, columns (the default format)
-    for i, db in enumerate(output_camelot):
-        # log.output('SUCCESS', f'found table: page {pg}, table {i}')
-        for key, value in extract_dir.items():
-            # build path for file and export
-            e_name = filename[:-4] + "-" + str(pg) + "-table-" + str(i) + "." + key
-            e_path = PurePath.joinpath(value, e_name)
-
-            # export to file
-            if key == "csv":
-                db.to_csv(str(e_path), index=False)
-            elif key == "json":
-                db.to_json(str(e_path), orient="columns")
-
-            # build cleaned path for database
-            db_path = PurePath(PurePath(e_path).parts[-3], key, PurePath(e_path).name)
-
-            # create csv database instance
-            Extracted.objects.create(
-                report=report_db,
-                file=str(db_path),
-                f_type=key,
-                page_num=pg,
-                table_num=i,
+    # previous code; left as many references to them...
+    pdf_file = file_path
+    pg = page_number
+
+    # pages already seen in any document return their stored tables
+    if getattr(settings, "EXTRACTION_PAGE_CACHE", False):
+        key = page_cache.page_hash(pdf_file, pg, report_db.parser, report_db.detector)
+        cached = page_cache.lookup(key)
+
+        if cached is not None:
+            tables, report, valid = restore_tables(
+                pdf_file, pg, cached, report_db.parser, report_db
             )
+            return {
+                "report": report,
+                "detector": "page cache",
+                "tables": page_tables(report_db, valid),
+                "extracted": export_tables(report_db, pg, tables, valid),
+            }
+    else:
+        key = None
+
+    # pages with a known layout reuse its confirmed regions, no render or Yolov3
+    if getattr(settings, "EXTRACTION_LAYOUT_CACHE", False):
+        # the text layer is parsed once for the layout and text detection
+        text_page = stream_parser.text_layer(pdf_file, pg)
+        layout = layout_cache.page_layout(pdf_file, pg, text_page)
+        template = layout_cache.match(layout)
+    else:
+        text_page = layout = template = None
+
+    if template is not None:
+        pdf_page = norm_pdf_page(pdf_file, pg)
+        found = np.array(template.regions, dtype=float).reshape(-1, 4)
+        tables = page_regions(report_db, pg, found, [None] * len(found))
+
+        report, valid = parse_tables(
+            pdf_file,
+            pg,
+            tables,
+            report_db.parser,
+            None,
+            pdf_page,
+            stream_parser.page_glyphs(pdf_file, pg, text_page),
+        )
+
+        # every stored region has to give a valid table again
+        if len(valid) == len(found):
+            write_behind.submit(pg, layout_cache.hit, template)
+            if key is not None:
+                write_behind.submit(pg, page_cache.store, key, tables, valid)
+            return {
+                "report": report,
+                "detector": "template",
+                "tables": page_tables(report_db, valid),
+                "extracted": export_tables(report_db, pg, tables, valid),
+            }
+
+        # stored regions gave fewer valid tables on this page, detect as usual
+
+    # text geometry detection, alone or as a first pass before Yolov3
+    if report_db.detector in ("text", "text+yolo"):
+        pdf_page, found, scores, glyphs = text_regions(pdf_file, pg, text_page)
+        tables = page_regions(report_db, pg, found, scores)
+
+        report, valid = parse_tables(
+            pdf_file, pg, tables, report_db.parser, None, pdf_page, glyphs
+        )
+
+        if valid or report_db.detector == "text":
+            write_behind.submit(pg, remember_page, layout, key, tables, valid)
+            return {
+                "report": report,
+                "detector": "text",
+                "tables": page_tables(report_db, valid),
+                "extracted": export_tables(report_db, pg, tables, valid),
+            }
+
+        # no valid tables from the text layer (e.g. scanned pages), run Yolov3
+
+    img, pdf_page, found, scores, stage = detect_regions(pdf_file, pg)
+
+    # keep detections so the page can be re-parsed without re-running Yolov3
+    tables = page_regions(report_db, pg, found, scores)
+
+    report, valid = parse_tables(
+        pdf_file, pg, tables, report_db.parser, img, pdf_page
+    )
+
+    write_behind.submit(pg, remember_page, layout, key, tables, valid)
 
     # log.output('INFO', f'finished processing page {page_number}')
 
-    return report
+    return {
+        "report": report,
+        "detector": "yolo",
+        "model": stage,
+        "tables": page_tables(report_db, valid),
+        "extracted": export_tables(report_db, pg, tables, valid),
+    }
+
+
+def remember_page(layout, key, tables, valid) -> None:
+    """
+    record a freshly detected and parsed page in the layout template cache
+    and the page cache, either may be None when switched off
+    """
+    # regions that gave valid tables confirm the page layout as a template
+    if layout is not None:
+        layout_cache.confirm(layout, [[t.x1, t.y1, t.x2, t.y2] for t, _ in valid])
+
+    if key is not None:
+        page_cache.store(key, tables, valid)
+
+
+def reparse_tables(file_path, page_number, output_type, report_db, extract_dir) -> dict:
+    """
+    re-runs only the parsing stage on a page's stored detections with the
+    report's current parser, the page is only rendered again for lattice parsing
+
+    returns dict of camelot parsing reports and the page's tables
+    """
+    pg = page_number
+
+    tables = list(Table.objects.filter(report=report_db, page_num=pg))
+
+    # remove the previous parse of this page
+    remove_page_outputs(file_path, pg, report_db, extract_dir)
+
+    if not tables:
+        return {"report": []}
+
+    pdf_page = norm_pdf_page(file_path, pg)
+    if report_db.parser in ("lattice", "auto"):
+        img = pdf_page2img(file_path, pg, save_image=False)
+    else:
+        img = None
+
+    report, valid = parse_tables(
+        file_path, pg, tables, report_db.parser, img, pdf_page
+    )
+
+    return {
+        "report": report,
+        "tables": page_tables(report_db, valid),
+        "extracted": export_tables(report_db, pg, tables, valid),
+    }
+
+
+def remove_page_outputs(file_path, pg, report_db, extract_dir) -> None:
+    """
+    remove any database instances of a partly processed page, their blob
+    references are released in one batch (see api/signals.py)
+    """
+    # tables still queued for writing are in before they are removed
+    write_behind.flush()
+
+    signals.delete_extracted(
+        report_db, Extracted.objects.filter(report=report_db, page_num=pg)
+    )
+
+
+def run_page(file_path, page_number, output_type, report_db, extract_dir, timeout=None, reparse=False) -> dict:
+    """
+    worker entry point, runs detect_tables() (or reparse_tables()) for a page
+    within its time budget and records the page status in the database
+
+    returns dict of page number, status ('ok', 'timed out' or 'failed'),
+    camelot parsing reports, detector, yolo model stage, tables for report
+    level exports, table output descriptors, seconds per stage and in total
+    and the worker pid
+    """
+    log = Logging()
+
+    stage = reparse_tables if reparse else detect_tables
+
+    start = timer()
+    stage_seconds.clear()
+
+    result = {
+        "page": page_number,
+        "status": "ok",
+        "report": [],
+        "detector": None,
+        "model": None,
+        "tables": [],
+        "extracted": [],
+        "timings": {},
+        "seconds": 0,
+        "pid": os.getpid(),
+    }
+
+    try:
+        with page_budget(timeout):
+            result.update(
+                stage(file_path, page_number, output_type, report_db, extract_dir)
+            )
+    except PageTimeoutError as e:
+        log.output("WARNING", f"page {page_number} stopped: {e}")
+        result["status"] = "timed out"
+    except Exception as e:
+        log.output("ERROR", f"page {page_number} failed: {e}")
+        result["status"] = "failed"
+
+    if result["status"] != "ok":
+        # clean up the page image and any partly exported tables
+        img_path = Path(file_path[:-4] + "-" + str(page_number) + ".jpg")
+        if img_path.exists():
+            Path.unlink(img_path)
+        remove_page_outputs(file_path, page_number, report_db, extract_dir)
+        result["extracted"] = []
+
+    result["timings"] = {name: round(t, 3) for name, t in stage_seconds.items()}
+    result["seconds"] = round(timer() - start, 3)
+
+    # re-parsed pages keep the detector of their detection run
+    defaults = {
+        "status": result["status"],
+        "tables": len(result["extracted"]),
+        "timings": result["timings"],
+        "seconds": result["seconds"],
+    }
+    if result["detector"] is not None:
+        defaults["detector"] = result["detector"]
+
+    write_behind.submit(
+        page_number,
+        Page.objects.update_or_create,
+        report=report_db,
+        page_num=page_number,
+        defaults=defaults,
+    )
+
+    # reported to the coordinator once the page's writes are made
+    write_behind.page_done(page_number)
+
+    return result
 
 
 # %%
@@ -7,16 +7,38 @@ from api.scripts.YOLOV3.utils.models import *  # set ONNX_EXPORT in models.py
 from api.scripts.YOLOV3.utils.datasets import *
 from api.scripts.YOLOV3.utils.utils import *
 
+#%%
+# loaded models per worker process, keyed by config, weights and image size
+_models = {}
+
+
+def load_model(opt, img_size, device):
+    # reuse the model this process already loaded for the same config and weights
+    key = (opt.cfg, opt.weights, img_size)
+    if key not in _models:
+        model = Darknet(opt.cfg, img_size)
+
+        # Load weights
+        attempt_download(opt.weights)
+        if opt.weights.endswith(".pt"):  # pytorch format
+            model.load_state_dict(torch.load(opt.weights, map_location=device)["model"])
+        else:  # darknet format
+            load_darknet_weights(model, opt.weights)
+
+        _models[key] = model
+
+    return _models[key]
+
+
 #%%
 def detectTable(opt):
     with torch.no_grad():
         img_size = (
             (320, 192) if ONNX_EXPORT else opt.img_size
         )  # (320, 192) or (416, 256) or (608, 352) for (height, width)
-        out, source, weights, half, view_img, save_txt = (
+        out, source, half, view_img, save_txt = (
             opt.output,
             opt.source,
-            opt.weights,
             opt.half,
             opt.view_img,
             opt.save_txt,
@@ -30,15 +52,8 @@ def detectTable(opt):
             shutil.rmtree(out)  # delete output folder
         os.makedirs(out)  # make new output folder
 
-        # Initialize model
-        model = Darknet(opt.cfg, img_size)
-
-        # Load weights
-        attempt_download(weights)
-        if weights.endswith(".pt"):  # pytorch format
-            model.load_state_dict(torch.load(weights, map_location=device)["model"])
-        else:  # darknet format
-            load_darknet_weights(model, weights)
+        # Initialize model and load weights, once per process
+        model = load_model(opt, img_size, device)
 
         # Second-stage classifier
         classify = False
@@ -156,25 +171,32 @@ def detectTable(opt):
 
 
 #%%
+## TINY MODEL <- config and weights must match; first stage run on every page
+TINY_MODEL = {
+    "cfg": "api/scripts/YOLOV3/utils/yolov3-tiny_table.cfg",
+    "weights": "api/scripts/YOLOV3/utils/best_v2.weights",      ## very good at 30%
+    "conf_thres": 0.30,
+}
+
+## HOLMS-UR MODEL <- config and weights must match (neeed to grab these from https://github.com/holms-ur/fine-tuning)
+## second stage, only run on pages the tiny model is unsure of
+FULL_MODEL = {
+    "cfg": "api/scripts/YOLOV3/utils/tablasFinaltrain416320.cfg",
+    "weights": "api/scripts/YOLOV3/utils/ICDAR19_tablebank_tablasFinaltrain_16000.weights",     ## very good at 40% [final contender]
+    #"weights": "api/scripts/YOLOV3/utils/Invoices_tablebank_tablasFinaltrain_19000.weights",   ## pretty good at 40%
+    #"weights": "api/scripts/YOLOV3/utils/tablasFinaltrain_10000.weights",                      ##
+    "conf_thres": 0.40,
+}
+
+
 class parameters:
-    def __init__(self, img):
-        ## CURRENT CONFIG <- config and weights must match
-        self.cfg = "api/scripts/YOLOV3/utils/yolov3-tiny_table.cfg"
-        
-        ## CURRENT WEIGHTS <- config and weights must match; and only select one weight
-        #self.weights = "api/scripts/YOLOV3/utils/best_v2.weights"      ## very good at 30%
-        self.weights = "api/scripts/YOLOV3/utils/best_v2.weights"   ## very good at 30%
-                                     
-        ## HOLMS-UR CONFIG <- config and weights must match (neeed to grab these from https://github.com/holms-ur/fine-tuning)
-        #self.cfg = "api/scripts/YOLOV3/utils/tablasFinaltrain416320.cfg"                            
-        
-        ## HOLMS-UR WEIGHTS <- config and weights must match; and only select one weight
-        #self.weights = "api/scripts/YOLOV3/utils/ICDAR19_tablebank_tablasFinaltrain_16000.weights"     ## very good at 40% [final contender]
-        #self.weights = "api/scripts/YOLOV3/utils/Invoices_tablebank_tablasFinaltrain_19000.weights"    ## pretty good at 40%
-        #self.weights = "api/scripts/YOLOV3/utils/tablasFinaltrain_10000.weights"                       ## 
-       
+    def __init__(self, img, model=TINY_MODEL, conf_thres=None):
+        ## config and weights of the selected model
+        self.cfg = model["cfg"]
+        self.weights = model["weights"]
+
         ## set inference confidence percentage
-        self.conf_thres = 0.30
+        self.conf_thres = model["conf_thres"] if conf_thres is None else conf_thres
 
         self.names = "api/scripts/YOLOV3/utils/table.names"
         self.source = img
@@ -0,0 +1,142 @@
+# file name: benchmark_detectors.py
+#
+# Description:
+#   speed and agreement benchmark of the text geometry table detector
+#   (api/scripts/text_detector.py) against the YOLOV3 detection path.
+#   For every page of every pdf in a local corpus directory both detectors
+#   are timed end to end (text: glyph read + detection, YOLOV3: render +
+#   inferencing + region post-processing) and their regions are matched
+#   at IoU >= 0.5, taking the YOLOV3 regions as reference.
+#
+# Usage:
+#   run cmd: python -m api.scripts.benchmark_detectors 'corpus_dir'
+#       optionally limit pages per document with --max-pages, time the
+#       text detector alone with --skip-yolo
+#
+# Help:
+#   run cmd: python -m api.scripts.benchmark_detectors --help
+#
+
+
+# get dependencies
+import os
+import argparse
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+from tabulate import tabulate
+from PyPDF2 import PdfFileReader
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lensell.settings")
+
+from api.scripts.YOLOV3.predict_table import detect_regions, text_regions
+
+
+def iou_matrix(regions_a: np.ndarray, regions_b: np.ndarray) -> np.ndarray:
+    """
+    pairwise intersection over union of x1, y1, x2, y2 (left-top,
+    right-bottom) regions
+    """
+    ax1, ay1, ax2, ay2 = (v[:, None] for v in regions_a.T)
+    bx1, by1, bx2, by2 = (v[None, :] for v in regions_b.T)
+
+    w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    h = np.clip(np.minimum(ay1, by1) - np.maximum(ay2, by2), 0, None)
+    inter = w * h
+    union = (ax2 - ax1) * (ay1 - ay2) + (bx2 - bx1) * (by1 - by2) - inter
+
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def benchmark_page(pdf_file: str, pg: int, skip_yolo: bool) -> dict:
+    """
+    time both detectors on a page and count the regions they agree on
+    """
+    start = timer()
+    _, text_found, _, _ = text_regions(pdf_file, pg)
+    text_time = timer() - start
+
+    row = {
+        "document": Path(pdf_file).name,
+        "page": pg,
+        "text regions": len(text_found),
+        "text s": text_time,
+    }
+
+    if skip_yolo:
+        return row
+
+    start = timer()
+    _, _, yolo_found, _, _ = detect_regions(pdf_file, pg)
+    yolo_time = timer() - start
+
+    matched = 0
+    if len(text_found) and len(yolo_found):
+        matched = int((iou_matrix(yolo_found, text_found) >= 0.5).any(axis=1).sum())
+
+    row.update(
+        {
+            "yolo regions": len(yolo_found),
+            "matched": matched,
+            "yolo s": yolo_time,
+        }
+    )
+
+    return row
+
+
+def run(corpus_dir: str, max_pages: int, skip_yolo: bool) -> None:
+    results = []
+
+    for pdf_file in sorted(Path(corpus_dir).glob("*.pdf")):
+        with open(pdf_file, "rb") as f:
+            total_pages = PdfFileReader(f, strict=False).getNumPages()
+
+        for pg in range(1, min(total_pages, max_pages) + 1):
+            results.append(benchmark_page(str(pdf_file), pg, skip_yolo))
+
+    if not results:
+        print("no pdf documents found in corpus")
+        return
+
+    print(tabulate(results, headers="keys", tablefmt="psql", floatfmt=".3f"))
+
+    text_total = sum(r["text s"] for r in results)
+    summary = [
+        ("pages", len(results)),
+        ("text regions", sum(r["text regions"] for r in results)),
+        ("text total s", text_total),
+        ("text s per page", text_total / len(results)),
+    ]
+
+    if not skip_yolo:
+        yolo_total = sum(r["yolo s"] for r in results)
+        yolo_regions = sum(r["yolo regions"] for r in results)
+        text_regions_total = sum(r["text regions"] for r in results)
+        matched = sum(r["matched"] for r in results)
+        summary += [
+            ("yolo regions", yolo_regions),
+            ("recall vs yolo", matched / yolo_regions if yolo_regions else float("nan")),
+            ("precision vs yolo", matched / text_regions_total if text_regions_total else float("nan")),
+            ("yolo total s", yolo_total),
+            ("speedup", yolo_total / text_total if text_total else float("nan")),
+        ]
+
+    print(tabulate(summary, tablefmt="fancy_grid", floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark text geometry table detector against YOLOV3"
+    )
+    parser.add_argument("corpus_dir", help="directory of pdf documents", type=str)
+    parser.add_argument(
+        "--max-pages", help="pages per document to benchmark", type=int, default=50
+    )
+    parser.add_argument(
+        "--skip-yolo", help="only time the text detector", action="store_true"
+    )
+    args = parser.parse_args()
+
+    run(args.corpus_dir, args.max_pages, args.skip_yolo)
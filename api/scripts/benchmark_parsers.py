@@ -0,0 +1,130 @@
+# file name: benchmark_parsers.py
+#
+# Description:
+#   parity and speed benchmark of the native stream parser
+#   (api/scripts/stream_parser.py) against camelot's 'stream' flavour.
+#   For every page of every pdf in a local corpus directory, camelot first
+#   finds the table areas on its own; both parsers are then timed on those
+#   same areas and their dataframes compared for shape and cell agreement.
+#
+# Usage:
+#   run cmd: python -m api.scripts.benchmark_parsers 'corpus_dir'
+#       optionally limit pages per document with --max-pages
+#
+# Help:
+#   run cmd: python -m api.scripts.benchmark_parsers --help
+#
+
+
+# get dependencies
+import argparse
+from pathlib import Path
+from timeit import default_timer as timer
+
+from tabulate import tabulate
+from PyPDF2 import PdfFileReader
+from camelot import io as camelot
+
+from api.scripts import stream_parser
+
+
+def table_area(table) -> str:
+    """
+    camelot table bbox as a table_areas string
+    """
+    x1, y1, x2, y2 = table._bbox
+    # camelot bbox is (x1, y1) left-bottom, (x2, y2) right-top
+    return ",".join(str(v) for v in (x1, y2, x2, y1))
+
+
+def cell_agreement(df_a, df_b) -> float:
+    """
+    fraction of equal (whitespace stripped) cells, 0 when shapes differ
+    """
+    if df_a.shape != df_b.shape:
+        return 0.0
+
+    a = df_a.astype(str).apply(lambda c: c.str.strip()).values
+    b = df_b.astype(str).apply(lambda c: c.str.strip()).values
+    return float((a == b).mean())
+
+
+def benchmark_page(pdf_file: str, pg: int) -> list:
+    """
+    time and compare both parsers on the table areas camelot finds on a page
+    """
+    found = camelot.read_pdf(pdf_file, pages=str(pg), flavor="stream")
+    areas = [table_area(t) for t in found]
+
+    if not areas:
+        return []
+
+    start = timer()
+    ref = camelot.read_pdf(
+        pdf_file, pages=str(pg), flavor="stream", table_areas=areas, backend="poppler"
+    )
+    camelot_time = timer() - start
+
+    start = timer()
+    native = stream_parser.read_pdf(pdf_file, pages=str(pg), table_areas=areas)
+    native_time = timer() - start
+
+    rows = []
+    for i, table in enumerate(ref):
+        other = native[i].df if i < len(native) else None
+        rows.append(
+            {
+                "document": Path(pdf_file).name,
+                "page": pg,
+                "table": i,
+                "camelot shape": table.df.shape,
+                "native shape": None if other is None else other.shape,
+                "cells equal": 0.0 if other is None else cell_agreement(table.df, other),
+                "camelot s": camelot_time / len(ref),
+                "native s": native_time / len(ref),
+            }
+        )
+
+    return rows
+
+
+def run(corpus_dir: str, max_pages: int) -> None:
+    results = []
+
+    for pdf_file in sorted(Path(corpus_dir).glob("*.pdf")):
+        with open(pdf_file, "rb") as f:
+            total_pages = PdfFileReader(f, strict=False).getNumPages()
+
+        for pg in range(1, min(total_pages, max_pages) + 1):
+            results.extend(benchmark_page(str(pdf_file), pg))
+
+    if not results:
+        print("no tables found in corpus")
+        return
+
+    print(tabulate(results, headers="keys", tablefmt="psql", floatfmt=".3f"))
+
+    camelot_total = sum(r["camelot s"] for r in results)
+    native_total = sum(r["native s"] for r in results)
+    summary = [
+        ("tables", len(results)),
+        ("shape parity", sum(r["camelot shape"] == r["native shape"] for r in results) / len(results)),
+        ("mean cell agreement", sum(r["cells equal"] for r in results) / len(results)),
+        ("camelot total s", camelot_total),
+        ("native total s", native_total),
+        ("speedup", camelot_total / native_total if native_total else float("nan")),
+    ]
+    print(tabulate(summary, tablefmt="fancy_grid", floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark native stream parser against camelot stream"
+    )
+    parser.add_argument("corpus_dir", help="directory of pdf documents", type=str)
+    parser.add_argument(
+        "--max-pages", help="pages per document to benchmark", type=int, default=50
+    )
+    args = parser.parse_args()
+
+    run(args.corpus_dir, args.max_pages)
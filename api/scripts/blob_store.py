@@ -0,0 +1,249 @@
+"""
+blob_store.py
+    version: 1.1
+
+Logic:
+    Content addressed store for extracted tables, shared by every report.
+    Repeated tables (fee schedules, rate tables, reprocessed reports) are
+    stored once instead of under each report's directory.
+
+    A table is addressed by the sha256 digest of its compact json cell matrix. Its
+    canonical file and materialized output files live together under
+    <MEDIA_ROOT>/blobs/<first two hex digits>/:
+
+        <digest>.cells.json.gz      canonical cells (table_store)
+        <digest>.<format>[.gz]      csv, json, xlsx outputs, on first request
+
+    Every Extracted instance points its file at the blob output of its
+    format and holds one reference on the Blob database model. Linking a
+    table that is already stored only adds references, no files are
+    written; when the last extraction referencing a blob is deleted (see
+    api/signals.py) its row and files are removed. Deleting a report
+    releases the references of all its extractions together.
+
+    References are only taken when the coordinator saves a job's
+    extractions, so workers reserve a blob (reserve()) before relying on
+    its canonical file being there. A blob reserved within the last
+    EXTRACTION_JOB_TIMEOUT seconds is kept at 0 references; reservations
+    that were never linked (dropped pages, failed jobs) are removed by
+    sweep() once they expire.
+
+Returns:
+    [dict]: [digest: linked Blob primary key]
+"""
+
+import json
+import hashlib
+
+from pathlib import Path, PurePath
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.models import Blob
+
+
+# blob store directory inside MEDIA_ROOT
+BLOBS_DIR = "blobs"
+
+# digests per query, below the SQLite bound variable limit
+BATCH_SIZE = 500
+
+# seconds a reservation is kept without a job budget (EXTRACTION_JOB_TIMEOUT None)
+RESERVATION = 3600
+
+
+def encode(cells: list) -> bytes:
+    """
+    compact json of a cell matrix, the bytes a table is addressed by
+    """
+    return json.dumps(cells, separators=(",", ":")).encode("utf-8")
+
+
+def digest(encoded: bytes) -> str:
+    """
+    content address of a table, sha256 hex digest of its encode() bytes
+    """
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def blob_dir(key: str) -> PurePath:
+    """
+    directory of a blob, relative to MEDIA_ROOT
+    """
+    return PurePath(BLOBS_DIR, key[:2])
+
+
+def output_name(key: str, f_type: str) -> str:
+    """
+    Extracted.file of a blob's output format, relative to MEDIA_ROOT
+    """
+    return str(blob_dir(key) / (key + "." + f_type))
+
+
+def link(sizes: dict, refs: dict) -> dict:
+    """
+    add references to blobs, creating those of new tables. Meant to run
+    inside the transaction saving the referencing Extracted instances
+
+    Args:
+        sizes (dict):   [digest: bytes of the compact json cells]
+        refs (dict):    [digest: Extracted instances to be linked]
+
+    Returns:
+        dict: [digest: Blob primary key]
+    """
+    keys = list(sizes)
+
+    Blob.objects.bulk_create(
+        [Blob(digest=key, size=sizes[key]) for key in keys],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    # one update per distinct reference count, usually the number of formats
+    by_count = {}
+    for key in keys:
+        by_count.setdefault(refs[key], []).append(key)
+
+    ids = {}
+    for count, group in by_count.items():
+        for i in range(0, len(group), BATCH_SIZE):
+            batch = group[i : i + BATCH_SIZE]
+            Blob.objects.filter(digest__in=batch).update(refs=F("refs") + count)
+            ids.update(Blob.objects.filter(digest__in=batch).values_list("digest", "id"))
+
+    return ids
+
+
+def reservation_cutoff():
+    """
+    reservations made before this time have expired
+    """
+    seconds = getattr(settings, "EXTRACTION_JOB_TIMEOUT", None) or RESERVATION
+
+    return timezone.now() - timedelta(seconds=seconds)
+
+
+def unreserved():
+    """
+    filter of blobs without a live reservation
+    """
+    return Q(reserved__isnull=True) | Q(reserved__lt=reservation_cutoff())
+
+
+def reserve(key: str, size: int) -> None:
+    """
+    keep a blob, and the files stored under it, until the job storing a
+    table of it links its extractions. Called ahead of checking whether the
+    canonical file exists: once the reservation is made a concurrent
+    release() no longer removes the blob, and a release() that got in first
+    has already removed its files
+
+    Args:
+        key (str):  [blob digest]
+        size (int): [bytes of the compact json cells]
+    """
+    now = timezone.now()
+
+    # the update takes the row's write lock, release() deletes under the same
+    if not Blob.objects.filter(digest=key).update(reserved=now):
+        try:
+            with transaction.atomic():
+                Blob.objects.create(digest=key, size=size, reserved=now)
+        except IntegrityError:
+            # created by another worker in the meantime
+            Blob.objects.filter(digest=key).update(reserved=now)
+
+    return None
+
+
+def remove_files(key: str) -> None:
+    """
+    remove the canonical and output files of a blob
+    """
+    for path in Path(settings.MEDIA_ROOT, blob_dir(key)).glob(key + ".*"):
+        path.unlink(missing_ok=True)
+
+    return None
+
+
+def sweep() -> int:
+    """
+    remove blobs left unreferenced once their reservation expired
+
+    Returns:
+        int: [blobs removed]
+    """
+    removed = 0
+    for blob in Blob.objects.filter(unreserved(), refs=0):
+        if Blob.objects.filter(unreserved(), pk=blob.pk, refs=0).delete()[0]:
+            remove_files(blob.digest)
+            removed += 1
+
+    return removed
+
+
+def references(extracted) -> dict:
+    """
+    blob references held by Extracted instances, counted in one query
+
+    Args:
+        extracted (QuerySet): [Extracted instances]
+
+    Returns:
+        dict: [Blob primary key: references]
+    """
+    return dict(
+        extracted.filter(blob__isnull=False)
+        .order_by()
+        .values("blob")
+        .annotate(n=Count("id"))
+        .values_list("blob", "n")
+    )
+
+
+def release(refs: dict) -> None:
+    """
+    drop references to blobs, removing the rows and files of those left
+    without any
+
+    Args:
+        refs (dict): [Blob primary key: references dropped]
+    """
+    # one update per distinct reference count, usually the number of formats
+    by_count = {}
+    for blob_id, count in refs.items():
+        by_count.setdefault(count, []).append(blob_id)
+
+    for count, group in by_count.items():
+        for i in range(0, len(group), BATCH_SIZE):
+            Blob.objects.filter(pk__in=group[i : i + BATCH_SIZE]).update(
+                refs=Greatest(F("refs") - count, 0)
+            )
+
+    ids = list(refs)
+    for i in range(0, len(ids), BATCH_SIZE):
+        batch = ids[i : i + BATCH_SIZE]
+
+        keys = list(
+            Blob.objects.filter(unreserved(), pk__in=batch, refs=0).values_list("digest", flat=True)
+        )
+        if not keys:
+            continue
+
+        # only delete when still unreferenced and unreserved, a concurrent
+        # link() or a worker's reserve() may have won
+        Blob.objects.filter(unreserved(), digest__in=keys, refs=0).delete()
+        kept = set(Blob.objects.filter(digest__in=keys).values_list("digest", flat=True))
+
+        for key in keys:
+            if key not in kept:
+                remove_files(key)
+
+    return None
@@ -0,0 +1,339 @@
+"""
+exports.py
+    version: 1.1
+
+Logic:
+    Report level exports, one output per document rather than one file per
+    table. Workers return the cell matrices of each page's valid tables in
+    their page result. Once the job's page writes are confirmed the
+    coordinator hands the result of every saved page to the report's
+    exporters, in page order, so pages dropped for failed writes are never
+    exported and no exporter ever holds the whole document.
+
+    Exporters are selected per job through Report.exports:
+
+        'parquet':  one Parquet dataset per document, partitioned by page
+                    (parquet/page=N/part-0.parquet). Cells are stored in a
+                    tidy layout, one row per cell, with numeric, date and
+                    currency typing applied once per page with vectorised
+                    pandas string operations.
+        'ndjson':   one newline delimited json file per document, one line
+                    per table with its page, table number, region, parsing
+                    report and cell rows, in page order.
+        'xlsx':     one Excel workbook per document, one sheet per table
+                    named p<page>-t<table>. Written with XlsxWriter in
+                    constant memory mode, rows are streamed to disk as each
+                    table arrives, numeric cells are written as numbers.
+
+Returns:
+    [dict]: [export type: exported path, relative to MEDIA_ROOT]
+"""
+
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path, PurePath
+
+
+# currency symbols and codes recognised in cells
+CURRENCY = r"([$€£¥]|\b(?:AUD|USD|EUR|GBP|NZD|CAD|JPY)\b)"
+
+# plain number once currency, thousands separators and sign markers are removed
+NUMBER = r"-?(?:\d+\.?\d*|\.\d+)"
+
+# date layouts tried in order, day first as on the statements we extract
+DATE_FORMATS = ("%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d", "%d-%m-%Y", "%d %b %Y", "%d %B %Y", "%d-%b-%Y", "%d %b %y")
+
+# Parquet column compression
+PARQUET_COMPRESSION = "zstd"
+
+
+def type_cells(text: pd.Series) -> pd.DataFrame:
+    """
+    typed views of table cell text. Amounts in brackets or with a trailing
+    minus or DR are negative, a trailing % or CR is dropped
+
+    Args:
+        text (pd.Series): [cell text]
+
+    Returns:
+        pd.DataFrame: [number (float), date (datetime) and currency (str) columns,
+                       missing where the cell holds no such value]
+    """
+    text = text.fillna("").astype(str).str.strip()
+
+    currency = text.str.extract(CURRENCY, expand=False)
+
+    bare = text.str.replace(CURRENCY, "", regex=True).str.replace(r"[,\s]", "", regex=True)
+    bare = bare.str.upper()
+
+    negative = (
+        bare.str.match(r"^\(.*\)")
+        | bare.str.endswith("-")
+        | bare.str.endswith("DR")
+    )
+    bare = bare.str.replace(r"^\((.*)\)", r"\1", regex=True)
+    bare = bare.str.replace(r"(?:CR|DR|%|-)$", "", regex=True)
+
+    number = pd.to_numeric(bare.where(bare.str.fullmatch(NUMBER)), errors="coerce")
+    number = number.where(~negative, -number)
+
+    date = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+    candidates = text.where(number.isna() & text.str.contains(r"\d"))
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(candidates, format=fmt, errors="coerce")
+        date = date.fillna(parsed)
+
+    return pd.DataFrame(
+        {
+            "number": number.astype(float),
+            "date": date,
+            "currency": currency.where(number.notna()),
+        }
+    )
+
+
+def tidy_cells(page: int, tables: list) -> pd.DataFrame:
+    """
+    one row per cell of a page's tables, with typed cell values
+
+    Args:
+        page (int):     [page number]
+        tables (list):  [page_tables() entries, {"table": table_num, "df": dataframe, ...}]
+
+    Returns:
+        pd.DataFrame: [page, table, row, col, text, number, date, currency]
+    """
+    frames = []
+    for entry in tables:
+        values = entry["df"].values
+        rows, cols = np.indices(values.shape)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "table": entry["table"],
+                    "row": rows.ravel(),
+                    "col": cols.ravel(),
+                    "text": pd.Series(values.ravel(), dtype=object).fillna("").astype(str),
+                }
+            )
+        )
+
+    cells = pd.concat(frames, ignore_index=True)
+    cells.insert(0, "page", page)
+
+    return pd.concat([cells, type_cells(cells["text"])], axis=1)
+
+
+def table_lines(page: int, tables: list) -> list:
+    """
+    ndjson lines of a page's tables, one per table with its page, table
+    number, region, parsing report and cell rows
+
+    Args:
+        page (int):     [page number]
+        tables (list):  [page_tables() entries]
+
+    Returns:
+        list: [json lines, newline terminated]
+    """
+    return [
+        json.dumps(
+            {
+                "page": page,
+                "table": entry["table"],
+                "region": entry["region"],
+                "parsing_report": entry["parsing_report"],
+                "rows": entry["df"].fillna("").astype(str).values.tolist(),
+            }
+        )
+        + "\n"
+        for entry in tables
+    ]
+
+
+def part_name(page: int) -> str:
+    """
+    parquet part file of a page, relative to the dataset directory
+    """
+    return f"page={page}/part-0.parquet"
+
+
+def parquet_pages(dataset: Path) -> list:
+    """
+    pages with a part file in a parquet dataset, in page order
+    """
+    return sorted(int(part.parent.name.split("=")[1]) for part in dataset.glob("page=*/*.parquet"))
+
+
+class ReportExporter:
+    """
+    base report level exporter, receives the tables of each saved page in
+    page order and is closed once all pages are in, or the job failed
+    """
+
+    export_type = None
+
+    def __init__(self, working_dir):
+        self.working_dir = Path(working_dir)
+
+    def add_page(self, page: int, tables: list) -> None:
+        raise NotImplementedError
+
+    def close(self) -> str:
+        """
+        finish the export, returns its path relative to MEDIA_ROOT
+        """
+        raise NotImplementedError
+
+
+class ParquetExporter(ReportExporter):
+    """
+    Parquet dataset of all tables of a document, partitioned by page
+    """
+
+    export_type = "parquet"
+
+    def __init__(self, working_dir):
+        super().__init__(working_dir)
+
+        # optional dependency, only needed when the export is selected
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+
+        self.path = self.working_dir / "parquet"
+
+        # a new export replaces the previous one
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+
+    def add_page(self, page: int, tables: list) -> None:
+        if not tables:
+            return None
+
+        cells = tidy_cells(page, tables).drop(columns="page")
+
+        part = self.path / part_name(page)
+        part.parent.mkdir(exist_ok=True)
+
+        self.pq.write_table(
+            self.pa.Table.from_pandas(cells, preserve_index=False),
+            str(part),
+            compression=PARQUET_COMPRESSION,
+        )
+
+        return None
+
+    def close(self) -> str:
+        return str(PurePath(self.path.parent.name, self.path.name))
+
+
+class NdjsonExporter(ReportExporter):
+    """
+    newline delimited json of all tables of a document, one line per table
+    """
+
+    export_type = "ndjson"
+
+    def __init__(self, working_dir):
+        super().__init__(working_dir)
+
+        self.path = self.working_dir / (self.working_dir.name + "-tables.ndjson")
+
+        # a new export replaces the previous one
+        self.file = open(self.path, "w", encoding="utf-8")
+
+    def add_page(self, page: int, tables: list) -> None:
+        self.file.writelines(table_lines(page, tables))
+
+        # readable up to the last exported page while the rest are written
+        self.file.flush()
+
+        return None
+
+    def close(self) -> str:
+        self.file.close()
+        return str(PurePath(self.path.parent.name, self.path.name))
+
+
+class XlsxExporter(ReportExporter):
+    """
+    Excel workbook of all tables of a document, one sheet per table
+    """
+
+    export_type = "xlsx"
+
+    def __init__(self, working_dir):
+        super().__init__(working_dir)
+
+        # optional dependency, only needed when the export is selected
+        import xlsxwriter
+
+        self.path = self.working_dir / (self.working_dir.name + "-tables.xlsx")
+
+        # rows are flushed to temp files as written, never held per workbook
+        self.workbook = xlsxwriter.Workbook(
+            str(self.path), {"constant_memory": True, "nan_inf_to_errors": True}
+        )
+
+    def add_page(self, page: int, tables: list) -> None:
+        for entry in tables:
+            values = entry["df"].fillna("").astype(str).values
+            number = type_cells(pd.Series(values.ravel())).number.to_numpy()
+
+            # numbers where the cell parsed as one, text otherwise
+            cells = np.where(np.isnan(number), values.ravel(), number.astype(object))
+            cells = cells.reshape(values.shape)
+
+            sheet = self.workbook.add_worksheet(f"p{page}-t{entry['table']}")
+            for r, row in enumerate(cells.tolist()):
+                sheet.write_row(r, 0, row)
+
+        return None
+
+    def close(self) -> str:
+        # an empty workbook still needs a sheet to be valid
+        if not self.workbook.worksheets():
+            self.workbook.add_worksheet("no tables")
+
+        self.workbook.close()
+        return str(PurePath(self.path.parent.name, self.path.name))
+
+
+# export type: exporter class
+EXPORTERS = {
+    ParquetExporter.export_type: ParquetExporter,
+    NdjsonExporter.export_type: NdjsonExporter,
+    XlsxExporter.export_type: XlsxExporter,
+}
+
+
+def open_exporters(exports: list, working_dir) -> list:
+    """
+    create the exporters selected for a report
+
+    Args:
+        exports (list):     [Report.exports types]
+        working_dir (str):  [the working directory of the Report]
+
+    Returns:
+        list: [ReportExporter instances]
+    """
+    exporters = []
+    try:
+        for e in exports:
+            exporters.append(EXPORTERS[e](working_dir))
+    except Exception:
+        # exporters opened before the failing one are not left open
+        for exporter in exporters:
+            exporter.close()
+        raise
+
+    return exporters
@@ -0,0 +1,183 @@
+"""
+job_queue.py
+    version: 1.0
+
+Logic:
+    Database backed extraction queue. Uploads queue a Job per report and the
+    extraction worker (python manage.py extraction_worker) claims the oldest
+    queued job with a conditional update, so several workers can drain the
+    same queue without running a job twice. run_job() runs
+    table_extract.extract() on the job's report, or table_extract.reparse()
+    for re-parse jobs, and stores the response on the job, or the error when
+    the job fails. Page
+    progress of a running job is read from the report's Page rows
+    (api/jobs/{id}/).
+
+    While a job runs its worker refreshes Job.heartbeat every
+    EXTRACTION_JOB_HEARTBEAT seconds. A worker killed mid job (deploy, out
+    of memory) leaves its job running with a stale heartbeat: workers call
+    recover() when they start and before every claim, which requeues jobs
+    whose heartbeat is older than EXTRACTION_JOB_STALE seconds, or fails
+    them once they have been claimed EXTRACTION_JOB_ATTEMPTS times.
+
+Returns:
+    [Job]: [claimed job]
+"""
+
+import os
+import socket
+import threading
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import Job
+from api.scripts import table_extract
+from api.scripts.logging import Logging
+
+
+# default seconds between heartbeats of a running job
+HEARTBEAT = 10
+
+# default seconds without a heartbeat before a running job is recovered
+STALE = 60
+
+# default claims of a job before a stale job is failed instead of requeued
+ATTEMPTS = 2
+
+
+def worker_name() -> str:
+    """
+    host:pid recorded on the jobs a process runs
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker: str):
+    """
+    take the oldest queued job, None when the queue is empty
+
+    Args:
+        worker (str): [host:pid recorded on the claimed job]
+
+    Returns:
+        [Job]: [claimed job, report selected]
+    """
+    for pk in Job.objects.filter(status="queued").values_list("pk", flat=True):
+        # another worker may claim the same job between the read and the update
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status="queued").update(
+            status="running",
+            started=now,
+            heartbeat=now,
+            worker=worker,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.select_related("report").get(pk=pk)
+
+    return None
+
+
+def recover() -> int:
+    """
+    requeue running jobs whose worker stopped sending heartbeats, or fail
+    them once they have used up their attempts
+
+    Returns:
+        int: [jobs recovered]
+    """
+    log = Logging()
+
+    stale = timezone.now() - timedelta(seconds=getattr(settings, "EXTRACTION_JOB_STALE", STALE))
+    attempts = getattr(settings, "EXTRACTION_JOB_ATTEMPTS", ATTEMPTS)
+
+    running = Job.objects.filter(
+        Q(heartbeat__lt=stale) | Q(heartbeat__isnull=True, started__lt=stale),
+        status="running",
+    )
+
+    failed = running.filter(attempts__gte=attempts).update(
+        status="failed",
+        finished=timezone.now(),
+        error=f"worker stopped responding, {attempts} attempts",
+    )
+    requeued = running.filter(attempts__lt=attempts).update(
+        status="queued", started=None, heartbeat=None, worker=""
+    )
+
+    if failed or requeued:
+        log.output("WARNING", f"stale jobs: {requeued} requeued, {failed} failed")
+
+    return failed + requeued
+
+
+def beat(job_pk: int, stop: threading.Event, interval: float) -> None:
+    """
+    heartbeat thread of a running job, until stop is set
+    """
+    while not stop.wait(interval):
+        try:
+            Job.objects.filter(pk=job_pk, status="running").update(heartbeat=timezone.now())
+        except DatabaseError as e:
+            # a busy database skips a beat, the next one is retried
+            Logging().output("WARNING", f"job {job_pk}: heartbeat {e}")
+
+    connection.close()
+
+    return None
+
+
+def run_job(job: Job) -> None:
+    """
+    run a claimed job's extraction and store its outcome on the job
+
+    Args:
+        job (Job): [job claimed by this process]
+    """
+    log = Logging()
+
+    report = job.report
+
+    stop = threading.Event()
+    interval = getattr(settings, "EXTRACTION_JOB_HEARTBEAT", HEARTBEAT)
+    threading.Thread(
+        target=beat, args=(job.pk, stop, interval), name=f"heartbeat-{job.pk}", daemon=True
+    ).start()
+
+    try:
+        if report is None:
+            raise FileNotFoundError("report removed before extraction")
+
+        if job.kind == "reparse":
+            log.output("INFO", f"job {job.pk}: re-parsing report {report.pk}...")
+            result = table_extract.reparse(report, job.parser or report.parser)
+        else:
+            log.output("INFO", f"job {job.pk}: extracting report {report.pk}...")
+            result = table_extract.extract(
+                report.document.path, report.start_page, report.end_page
+            )
+
+    except Exception as e:
+        error_output = f"{type(e).__name__}: {e}"
+        log.output("ERROR", f"job {job.pk}: {error_output}")
+
+        # update() only, the extraction may have removed the report
+        Job.objects.filter(pk=job.pk).update(
+            status="failed", finished=timezone.now(), error=error_output
+        )
+        return None
+
+    finally:
+        stop.set()
+
+    Job.objects.filter(pk=job.pk).update(
+        status="done", finished=timezone.now(), result=result
+    )
+    log.output("SUCCESS", f"job {job.pk}: done")
+
+    return None
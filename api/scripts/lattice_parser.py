@@ -0,0 +1,258 @@
+"""
+lattice_parser.py
+    version: 1.0
+
+Logic:
+    Lattice style parsing for ruled tables that reuses the page raster
+    already rendered for YOLOV3 detection, instead of camelot 'lattice'
+    rendering the page a second time through ghostscript/poppler.
+
+    Each detected table area is cropped out of the page image, ruling lines
+    are found with OpenCV morphology (adaptive threshold, then opening with
+    long horizontal and vertical kernels), and the line positions mapped
+    back to pdf space become the cell boundaries. Glyph text from the pdf
+    text layer is then dropped into those cells with numpy searchsorted.
+
+    is_ruled() is the cheap per table selector used by the 'auto' parser:
+    areas with a ruling grid go to lattice, the rest to the native stream
+    parser.
+
+Returns:
+    [list]: [LatticeTable objects exposing .df and .parsing_report]
+"""
+
+import cv2
+import numpy as np
+
+from api.scripts import stream_parser
+
+
+class LatticeTable(stream_parser.StreamTable):
+    """
+    parsed ruled table container
+    """
+
+    flavor = "lattice"
+
+
+def area_pixels(area: list, img_shape: tuple, page_size: tuple) -> tuple:
+    """
+    map a pdf space table area onto page image pixel bounds
+
+    Args:
+        area (list):        [x1, y1, x2, y2 left-top, right-bottom in pdf space]
+        img_shape (tuple):  [page image shape (H, W, ...)]
+        page_size (tuple):  [pdf page (W, H)]
+
+    Returns:
+        tuple: [left, top, right, bottom pixel bounds clipped to the image]
+    """
+    H_img, W_img = img_shape[:2]
+    W_pdf, H_pdf = page_size
+    x1, y1, x2, y2 = area
+
+    left = int(np.clip(x1 / W_pdf * W_img, 0, W_img))
+    right = int(np.clip(x2 / W_pdf * W_img, 0, W_img))
+    top = int(np.clip((1 - y1 / H_pdf) * H_img, 0, H_img))
+    bottom = int(np.clip((1 - y2 / H_pdf) * H_img, 0, H_img))
+
+    return left, top, right, bottom
+
+
+def _line_positions(mask: np.ndarray, axis: int, min_len: int) -> np.ndarray:
+    """
+    centre positions of runs of mask rows (axis=1) or columns (axis=0)
+    holding at least min_len line pixels
+    """
+    proj = (mask > 0).sum(axis=axis)
+    idx = np.flatnonzero(proj >= min_len)
+
+    if len(idx) == 0:
+        return idx.astype(float)
+
+    runs = np.split(idx, np.flatnonzero(np.diff(idx) > 1) + 1)
+    return np.array([run.mean() for run in runs])
+
+
+def ruling_lines(crop: np.ndarray, h_len: int, v_len: int) -> tuple:
+    """
+    find horizontal and vertical ruling lines in a cropped table image
+
+    Args:
+        crop (np.ndarray):  [RGB or grayscale image crop]
+        h_len (int):        [shortest horizontal line kept, in pixels]
+        v_len (int):        [shortest vertical line kept, in pixels]
+
+    Returns:
+        tuple: [(y positions of horizontal lines, x positions of vertical
+                lines) in crop pixels]
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    binary = cv2.adaptiveThreshold(
+        np.invert(gray), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, -2
+    )
+
+    h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (h_len, 1))
+    v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, v_len))
+
+    h_mask = cv2.morphologyEx(binary, cv2.MORPH_OPEN, h_kernel)
+    v_mask = cv2.morphologyEx(binary, cv2.MORPH_OPEN, v_kernel)
+
+    return _line_positions(h_mask, 1, h_len), _line_positions(v_mask, 0, v_len)
+
+
+def table_lines(img: np.ndarray, page_size: tuple, area: list, line_scale=40) -> tuple:
+    """
+    ruling lines of a table area in pdf space, the shortest line kept is
+    the page image size divided by line_scale (long enough to ignore glyph
+    strokes, short enough for two row tables)
+
+    Args:
+        img (np.ndarray):               [page image rendered for detection]
+        page_size (tuple):              [pdf page (W, H)]
+        area (list):                    [x1, y1, x2, y2 left-top, right-bottom]
+        line_scale (int, optional):     [page size divisor]. Defaults to 40.
+
+    Returns:
+        tuple: [(y of horizontal lines top to bottom, x of vertical lines
+                left to right) in pdf space]
+    """
+    left, top, right, bottom = area_pixels(area, img.shape, page_size)
+
+    if right - left < 2 or bottom - top < 2:
+        return np.empty(0), np.empty(0)
+
+    H_img, W_img = img.shape[:2]
+    rows, cols = ruling_lines(
+        img[top:bottom, left:right], W_img // line_scale, H_img // line_scale
+    )
+
+    W_pdf, H_pdf = page_size
+    ys = (1 - (rows + top) / H_img) * H_pdf
+    xs = (cols + left) / W_img * W_pdf
+
+    return ys, xs
+
+
+def is_ruled(lines: tuple, min_lines=2) -> bool:
+    """
+    cheap stream / lattice selector, a table is ruled when it has at least
+    min_lines horizontal and vertical ruling lines
+
+    Args:
+        lines (tuple):              [table_lines() output]
+        min_lines (int, optional):  [lines needed on both axes]. Defaults to 2.
+
+    Returns:
+        bool: [True when the area should be lattice parsed]
+    """
+    ys, xs = lines
+    return len(ys) >= min_lines and len(xs) >= min_lines
+
+
+def parse_table(boxes: np.ndarray, text: np.ndarray, area: list, lines: tuple, order=1, page=1):
+    """
+    parse the glyphs inside one ruled table area into a LatticeTable, cells
+    are bounded by the ruling lines closed off by the area edges, all empty
+    rows and columns (the slivers outside a table border) are dropped
+
+    Args:
+        boxes (np.ndarray):     [(N, 4) glyph boxes for the page]
+        text (np.ndarray):      [(N,) glyph text for the page]
+        area (list):            [x1, y1, x2, y2 left-top, right-bottom]
+        lines (tuple):          [table_lines() output]
+        order (int, optional):  [table order on page]. Defaults to 1.
+        page (int, optional):   [page number]. Defaults to 1.
+
+    Returns:
+        [LatticeTable]: [parsed table, None if the area holds no text]
+    """
+    mask = stream_parser.glyphs_in_area(boxes, area)
+    if not mask.any():
+        return None
+
+    boxes, text = boxes[mask], text[mask]
+
+    ys, xs = lines
+    row_edges = np.sort(ys)
+    col_edges = np.sort(xs)
+    n_cols = len(col_edges) + 1
+
+    # glyphs are placed in columns first so no text segment crosses a
+    # vertical ruling line, segments keep the reading order of each cell
+    cols = np.searchsorted(col_edges, (boxes[:, 0] + boxes[:, 2]) / 2)
+    rows = stream_parser.group_rows(boxes)
+    seg_boxes, seg_text, seg_keys = stream_parser.group_segments(
+        boxes, text, rows * n_cols + cols
+    )
+
+    # pdf y grows upwards, row 0 is the top row
+    yc = (seg_boxes[:, 1] + seg_boxes[:, 3]) / 2
+    seg_rows = len(row_edges) - np.searchsorted(row_edges, yc)
+    seg_cols = seg_keys % n_cols
+
+    df = stream_parser.build_frame(
+        seg_text, seg_rows, seg_cols, len(row_edges) + 1, n_cols
+    )
+
+    empty = df.values == ""
+    df = df.loc[~empty.all(axis=1), ~empty.all(axis=0)]
+    df = df.reset_index(drop=True)
+    df.columns = range(df.shape[1])
+
+    # accuracy: share of glyphs that do not cross a vertical ruling line
+    spill = np.searchsorted(col_edges, boxes[:, 0]) != np.searchsorted(col_edges, boxes[:, 2])
+    whitespace = (df.values == "").sum() / df.size if df.size else 1.0
+
+    parsing_report = {
+        "accuracy": round(float(100 * (1 - spill.mean())), 2),
+        "whitespace": round(float(100 * whitespace), 2),
+        "order": order,
+        "page": page,
+    }
+
+    # bbox in camelot's order, (x1, y1) left-bottom, (x2, y2) right-top
+    x1, y1, x2, y2 = area
+    return LatticeTable(df, parsing_report, (x1, y2, x2, y1))
+
+
+def read_pdf(filepath: str, pages: str, table_areas: list, img: np.ndarray, page_size: tuple, auto=False, glyphs=None) -> list:
+    """
+    lattice-parse table areas on a single pdf page using the page image
+    rendered for detection. With auto=True each area is routed by is_ruled()
+    to lattice parsing or to the native stream parser.
+
+    Args:
+        filepath (str):             [path location of pdf file]
+        pages (str):                [page number to parse]
+        table_areas (list):         [camelot style "x1,y1,x2,y2" strings]
+        img (np.ndarray):           [page image rendered for detection]
+        page_size (tuple):          [pdf page (W, H)]
+        auto (bool, optional):      [select stream or lattice per table].
+                                     Defaults to False.
+        glyphs (tuple, optional):   [pre-read page_glyphs() output]. Defaults to None.
+
+    Returns:
+        list: [LatticeTable / StreamTable objects, one per area holding text]
+    """
+    pg = int(pages)
+    boxes, text = glyphs if glyphs is not None else stream_parser.page_glyphs(filepath, pg)
+
+    tables = []
+    if len(boxes) == 0:
+        return tables
+
+    for area in table_areas:
+        area = stream_parser.parse_area(area)
+        lines = table_lines(img, page_size, area)
+        order = len(tables) + 1
+
+        if auto and not is_ruled(lines):
+            table = stream_parser.parse_table(boxes, text, area, order=order, page=pg)
+        else:
+            table = parse_table(boxes, text, area, lines, order=order, page=pg)
+
+        if table is not None:
+            tables.append(table)
+
+    return tables
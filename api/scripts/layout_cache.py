@@ -0,0 +1,280 @@
+"""
+layout_cache.py
+    version: 1.2
+
+Logic:
+    Layout fingerprint template cache for recurring documents. Statements
+    from the same issuer keep their tables in the same place month to month,
+    so a page whose layout matches a previously confirmed page can skip
+    rendering and YOLOV3 inferencing and go straight to parsing with the
+    stored table regions.
+
+    A page fingerprint is its size plus a coarse occupancy grid of the text
+    blocks in its text layer (pdfminer, no rasterisation). Fingerprints are
+    stored in the LayoutTemplate database model together with the table
+    regions that produced valid tables and the x positions their text lines
+    start at (the table's columns).
+
+    Candidate templates are looked up by an indexed header key, the page
+    size and the grid's top HEADER_ROWS rows, where an issuer's letterhead
+    stays put while the length of its tables changes. A page matches a
+    candidate when the grids' jaccard similarity is at least
+    EXTRACTION_LAYOUT_MATCH and, inside every stored region, the page's
+    column starts agree with the template's (EXTRACTION_LAYOUT_COLUMNS of
+    them within ALIGN points). Dense text pages of the same size have
+    similar grids, the column check keeps a template from matching a page
+    whose tables are laid out differently. A template's hits, which rank
+    the candidates, only count matches whose regions all gave valid tables
+    again (hit()).
+
+Returns:
+    [LayoutTemplate]: [matched template or None]
+"""
+
+import hashlib
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import F
+
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTTextBox, LTTextLine
+
+from api.models import LayoutTemplate
+
+
+# occupancy grid rows, columns
+GRID_SHAPE = (16, 12)
+
+# top grid rows of the indexed header key
+HEADER_ROWS = 4
+
+# most used templates compared per page
+CANDIDATES = 20
+
+# points between text line starts of the same column
+ALIGN = 3.0
+
+# default share of a region's columns found on both pages
+COLUMNS = 0.8
+
+
+class PageLayout:
+    """
+    page size, text block occupancy grid and text line boxes of a pdf page
+    """
+
+    def __init__(self, width, height, grid, lines):
+        self.width = width
+        self.height = height
+        self.grid = grid
+        self.lines = lines
+
+    @property
+    def bits(self) -> str:
+        return "".join("1" if v else "0" for v in self.grid.ravel())
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(f"{self.width}x{self.height}:{self.bits}".encode()).hexdigest()
+
+    @property
+    def header(self) -> str:
+        top = self.bits[: HEADER_ROWS * GRID_SHAPE[1]]
+        return hashlib.sha1(f"{self.width}x{self.height}:{top}".encode()).hexdigest()
+
+    def columns(self, region) -> list:
+        """
+        column starts of the text lines centred inside a x1, y1, x2, y2 region
+        """
+        x1, y1, x2, y2 = region
+        cx = (self.lines[:, 0] + self.lines[:, 2]) / 2
+        cy = (self.lines[:, 1] + self.lines[:, 3]) / 2
+
+        inside = (
+            (cx >= min(x1, x2)) & (cx <= max(x1, x2)) & (cy >= min(y1, y2)) & (cy <= max(y1, y2))
+        )
+
+        return column_starts(self.lines[inside, 0])
+
+
+def page_layout(pdf_file: str, pg: int, page=None) -> PageLayout:
+    """
+    build the layout fingerprint of a pdf page from its text layer
+
+    Args:
+        pdf_file (str):             [path location of pdf file]
+        pg (int):                   [page number, starting at 1]
+        page (LTPage, optional):    [pdfminer layout of the page, parsed when
+                                     None]. Defaults to None.
+
+    Returns:
+        PageLayout: [page fingerprint]
+    """
+    if page is None:
+        page = next(extract_pages(pdf_file, page_numbers=[pg - 1], laparams=LAParams()))
+    blocks = [obj for obj in page if isinstance(obj, LTTextBox)]
+    lines = [line.bbox for obj in blocks for line in obj if isinstance(line, LTTextLine)]
+
+    width, height = page.width, page.height
+    grid = occupancy_grid(
+        np.array([obj.bbox for obj in blocks], dtype=float).reshape(-1, 4), width, height
+    )
+
+    return PageLayout(
+        int(round(width)), int(round(height)), grid, np.array(lines, dtype=float).reshape(-1, 4)
+    )
+
+
+def occupancy_grid(blocks: np.ndarray, width: float, height: float) -> np.ndarray:
+    """
+    coarse grid of the cells overlapped by any text block
+
+    Args:
+        blocks (np.ndarray):    [(N, 4) text block boxes x0, y0, x1, y1]
+        width (float):          [page width]
+        height (float):         [page height]
+
+    Returns:
+        np.ndarray: [GRID_SHAPE bool grid, row 0 is the top of the page]
+    """
+    rows, cols = GRID_SHAPE
+
+    if len(blocks) == 0:
+        return np.zeros(GRID_SHAPE, dtype=bool)
+
+    # cell edges in pdf space, top row first
+    y_edges = height * (1 - np.arange(rows + 1) / rows)
+    x_edges = width * np.arange(cols + 1) / cols
+
+    in_y = (blocks[:, 1:2] < y_edges[None, :-1]) & (blocks[:, 3:4] > y_edges[None, 1:])
+    in_x = (blocks[:, 0:1] < x_edges[None, 1:]) & (blocks[:, 2:3] > x_edges[None, :-1])
+
+    return (in_y[:, :, None] & in_x[:, None, :]).any(axis=0)
+
+
+def column_starts(x0: np.ndarray) -> list:
+    """
+    x positions shared by the starts of at least two text lines, lines
+    starting within ALIGN points of each other belong to the same column
+
+    Args:
+        x0 (np.ndarray): [text line left edges]
+
+    Returns:
+        list: [column start x positions, left to right]
+    """
+    starts = []
+
+    for cluster in np.split(np.sort(x0), np.where(np.diff(np.sort(x0)) > ALIGN)[0] + 1):
+        if len(cluster) >= 2:
+            starts.append(round(float(cluster.mean()), 1))
+
+    return starts
+
+
+def aligned(page: list, template: list) -> float:
+    """
+    share of the column starts of a region found on both pages, 0 when
+    either has none
+    """
+    if not page or not template:
+        return 0.0
+
+    page, template = np.array(page), np.array(template)
+    distance = np.abs(page[:, None] - template[None, :])
+
+    return float(
+        min(
+            (distance.min(axis=1) <= ALIGN).mean(),
+            (distance.min(axis=0) <= ALIGN).mean(),
+        )
+    )
+
+
+def match(layout: PageLayout):
+    """
+    find the best confirmed template for a page layout
+
+    Args:
+        layout (PageLayout): [page fingerprint]
+
+    Returns:
+        [LayoutTemplate]: [matched template, None if no confident match]
+    """
+    threshold = getattr(settings, "EXTRACTION_LAYOUT_MATCH", 0.9)
+    agreement = getattr(settings, "EXTRACTION_LAYOUT_COLUMNS", COLUMNS)
+
+    # blank pages carry no layout to match on
+    if not layout.grid.any():
+        return None
+
+    candidates = list(
+        LayoutTemplate.objects.filter(header=layout.header).order_by("-hits")[:CANDIDATES]
+    )
+    if not candidates:
+        return None
+
+    grids = np.array([[c == "1" for c in t.bits] for t in candidates])
+    page = layout.grid.ravel()
+
+    inter = (grids & page).sum(axis=1)
+    union = (grids | page).sum(axis=1)
+    score = inter / np.maximum(union, 1)
+
+    for best in np.argsort(-score, kind="stable"):
+        if score[best] < threshold:
+            return None
+
+        # the page's text lines must start where the template's tables
+        # have their columns, in every stored region
+        template = candidates[best]
+        if all(
+            aligned(layout.columns(region), columns) >= agreement
+            for region, columns in zip(template.regions, template.columns)
+        ):
+            return template
+
+    return None
+
+
+def hit(template) -> None:
+    """
+    count a use of a template, once its regions gave valid tables again on
+    the matched page
+    """
+    LayoutTemplate.objects.filter(pk=template.pk).update(hits=F("hits") + 1)
+
+    return None
+
+
+def confirm(layout: PageLayout, found: list) -> None:
+    """
+    store the regions of a page that produced valid tables under its layout
+
+    Args:
+        layout (PageLayout):    [page fingerprint]
+        found (list):           [confirmed x1, y1, x2, y2 regions]
+    """
+    if not found or not layout.grid.any():
+        return None
+
+    # regions without aligned columns could never be confirmed on a match
+    columns = [layout.columns(region) for region in found]
+    if not all(columns):
+        return None
+
+    LayoutTemplate.objects.update_or_create(
+        key=layout.key,
+        defaults={
+            "header": layout.header,
+            "width": layout.width,
+            "height": layout.height,
+            "bits": layout.bits,
+            "regions": [list(map(float, region)) for region in found],
+            "columns": columns,
+        },
+    )
+
+    return None
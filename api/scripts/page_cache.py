@@ -0,0 +1,161 @@
+"""
+page_cache.py
+    version: 1.0
+
+Logic:
+    Cross document page level result reuse. Many documents share identical
+    boilerplate pages (terms, rate tables, appendices); the duplicate check
+    in table_extract.extract() only catches whole file duplicates.
+
+    Every page gets a hash of its normalised content stream plus everything
+    its resources reference (fonts, images, forms) and the detector and
+    parser used, and
+    the PageCache database model maps page hashes to their extracted tables
+    (regions, parsing reports and cell values). Any page already seen in any
+    document returns its stored tables without rendering, detection or
+    parsing; pages without tables are stored too, so boilerplate text pages
+    are skipped as well.
+
+Returns:
+    [PageCache]: [stored page result or None]
+"""
+
+import re
+import hashlib
+
+from django.db.models import F
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    StreamObject,
+)
+
+from api.models import PageCache
+
+
+def _hash_object(obj, h, seen: set) -> None:
+    """
+    feed a pdf object and everything it references into a hash, indirect
+    objects are followed once so shared and cyclic references terminate
+
+    Args:
+        obj ([PdfObject]):  [pdf object]
+        h ([hashlib hash]): [hash to update]
+        seen (set):         [indirect references already followed]
+    """
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            h.update(b"R")
+            return
+        seen.add(ref)
+        obj = obj.getObject()
+
+    if isinstance(obj, StreamObject):
+        h.update(b"S")
+        h.update(hashlib.sha256(obj._data).digest())
+
+    if isinstance(obj, DictionaryObject):
+        h.update(b"<<")
+        for key in sorted(obj.keys()):
+            # parent links point back up the page tree
+            if key == "/Parent":
+                continue
+            h.update(str(key).encode())
+            _hash_object(obj.raw_get(key), h, seen)
+        h.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        h.update(b"[")
+        for item in obj:
+            _hash_object(item, h, seen)
+        h.update(b"]")
+    elif not isinstance(obj, StreamObject):
+        h.update(repr(obj).encode())
+
+
+def page_hash(pdf_file: str, pg: int, parser: str, detector="yolo") -> str:
+    """
+    hash of a page's normalised content stream, resources, size and the
+    detector and parser its tables are extracted with
+
+    Args:
+        pdf_file (str):             [path location of pdf file]
+        pg (int):                   [page number, starting at 1]
+        parser (str):               [Report.parser used for the page]
+        detector (str, optional):   [Report.detector used for the page].
+                                     Defaults to "yolo".
+
+    Returns:
+        str: [sha256 hex digest]
+    """
+    h = hashlib.sha256()
+    h.update(parser.encode())
+    h.update(detector.encode())
+
+    with open(pdf_file, "rb") as f:
+        page = PdfFileReader(f, strict=False).getPage(pg - 1)
+
+        h.update(repr([float(v) for v in page.mediaBox]).encode())
+
+        # content stream decoded and whitespace normalised, so the same
+        # drawing operators hash the same whatever the stream compression
+        contents = page.get("/Contents")
+        contents = contents.getObject() if contents is not None else []
+        streams = contents if isinstance(contents, ArrayObject) else [contents]
+        for stream in streams:
+            data = stream.getObject().getData()
+            h.update(re.sub(rb"\s+", b" ", data).strip())
+
+        _hash_object(page.raw_get("/Resources") if "/Resources" in page else None, h, set())
+
+    return h.hexdigest()
+
+
+def lookup(key: str):
+    """
+    stored result of a page hash
+
+    Args:
+        key (str): [page_hash() digest]
+
+    Returns:
+        [PageCache]: [stored page result, None when the page was not seen]
+    """
+    cached = PageCache.objects.filter(key=key).first()
+
+    if cached is not None:
+        PageCache.objects.filter(pk=cached.pk).update(hits=F("hits") + 1)
+
+    return cached
+
+
+def store(key: str, tables: list, valid: list) -> None:
+    """
+    store the extracted tables of a page under its hash
+
+    Args:
+        key (str):      [page_hash() digest]
+        tables (list):  [Table instances of the page, in region order]
+        valid (list):   [(Table, dataframe) of the exported tables]
+    """
+    cells = {id(table): df.values.tolist() for table, df in valid}
+
+    PageCache.objects.update_or_create(
+        key=key,
+        defaults={
+            "tables": [
+                {
+                    "region": [t.x1, t.y1, t.x2, t.y2],
+                    "confidence": t.confidence,
+                    "parsing_report": t.parsing_report,
+                    "table_num": t.table_num,
+                    "cells": cells.get(id(t)),
+                }
+                for t in tables
+            ]
+        },
+    )
+
+    return None
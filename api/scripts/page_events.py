@@ -0,0 +1,175 @@
+"""
+page_events.py
+    version: 1.2
+
+Logic:
+    Server-sent events of a report's extraction progress, for the report
+    events endpoint (api/reports/{id}/events/).
+
+    Workers record every finished page on its Page row: status, detector,
+    valid tables, seconds per stage (detect, parse, store) and in total.
+    stream() polls the report's Page rows every EXTRACTION_EVENTS_POLL
+    seconds and sends a 'page' event for each page changed since the last
+    poll, and a keep-alive comment when nothing changed. Pages finished
+    before the client connected are sent first. The polling (poll_pages())
+    also feeds streamed uploads (table_stream.py).
+
+    Once no extraction job of the report is queued or running the stream
+    sends a last 'done' event with the report aggregates, or 'failed' when
+    the extraction removed the report, and ends. A stream open for
+    EXTRACTION_EVENTS_TIMEOUT seconds, or without a page event for
+    EXTRACTION_EVENTS_IDLE seconds, ends with a 'timeout' event instead,
+    clients reconnect to follow the extraction further.
+
+Returns:
+    [generator]: [text/event-stream bytes]
+"""
+
+import json
+import time
+
+from datetime import timedelta
+from timeit import default_timer as timer
+
+from django.db import connection
+
+from api.models import Report, Page, Job
+
+
+# default seconds between polls of the report's pages
+POLL = 1
+
+# default seconds a stream stays open, and without page events, None for no limit
+TIMEOUT = 3600
+IDLE = 600
+
+# pages saved up to this long before the latest page seen may still be
+# committed after it (other workers' writes), they are read again each poll
+SETTLE = timedelta(seconds=5)
+
+# Page fields sent with every page event
+PAGE_FIELDS = ("page_num", "status", "detector", "tables", "seconds", "timings", "updated")
+
+# Report fields sent with the done event
+REPORT_FIELDS = ("tables_found", "pages_with_tables", "pages_processed", "processing_seconds")
+
+
+def event(name: str, data: dict, event_id=None) -> bytes:
+    """
+    one server-sent event, data sent as json
+    """
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"event: {name}", f"data: {json.dumps(data)}"]
+
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def page_event(page: dict) -> bytes:
+    """
+    'page' event of a Page row's PAGE_FIELDS values, id is the page number
+    """
+    data = {"page": page["page_num"]}
+    data.update((f, page[f]) for f in PAGE_FIELDS if f != "page_num")
+    data["updated"] = page["updated"].isoformat()
+
+    return event("page", data, data["page"])
+
+
+def poll_pages(
+    report_id: int, fields=PAGE_FIELDS, job_id=None, poll=POLL, timeout=TIMEOUT, idle=IDLE
+):
+    """
+    Page rows of a report changed since the previous poll, polled until its
+    extraction jobs are finished or the time limits. Shared by the events
+    stream and streamed uploads (table_stream.py)
+
+    Args:
+        report_id (int):            [Report id]
+        fields (tuple, optional):   [Page fields read, with page_num and updated]. Defaults to PAGE_FIELDS.
+        job_id (int, optional):     [only follow this job, else every job of the report]. Defaults to None.
+        poll (float, optional):     [seconds between polls]. Defaults to POLL.
+        timeout (float, optional):  [seconds of polling]. Defaults to TIMEOUT.
+        idle (float, optional):     [seconds without changed pages]. Defaults to IDLE.
+
+    Yields:
+        tuple: [(changed Page rows' fields values, None) each poll, and a last
+                ([], reason) when a time limit ended the polling]
+    """
+    jobs = Job.objects.filter(status__in=("queued", "running"))
+    jobs = jobs.filter(report_id=report_id) if job_id is None else jobs.filter(pk=job_id)
+
+    sent = {}
+    since = None
+
+    start = last_change = timer()
+
+    while True:
+        # read before the pages, so pages of a job finishing now are still sent
+        running = jobs.exists()
+
+        pages = Page.objects.filter(report_id=report_id).values(*fields)
+        if since is not None:
+            pages = pages.filter(updated__gte=since - SETTLE)
+
+        changed = []
+        for page in pages:
+            if sent.get(page["page_num"]) == page["updated"]:
+                continue
+
+            sent[page["page_num"]] = page["updated"]
+            since = page["updated"] if since is None else max(since, page["updated"])
+            changed.append(page)
+
+        yield changed, None
+
+        if not running:
+            return
+
+        now = timer()
+        if changed:
+            last_change = now
+
+        if timeout is not None and now - start > timeout:
+            yield [], f"stream open for {timeout} seconds"
+            return
+
+        if idle is not None and now - last_change > idle:
+            yield [], f"no page finished for {idle} seconds"
+            return
+
+        # do not hold the database connection between polls
+        connection.close()
+        time.sleep(poll)
+
+
+def stream(report_id: int, poll=POLL, timeout=TIMEOUT, idle=IDLE):
+    """
+    progress events of a report until its extraction jobs are finished, or
+    the stream's time limits
+
+    Args:
+        report_id (int):            [Report id]
+        poll (float, optional):     [seconds between polls]. Defaults to POLL.
+        timeout (float, optional):  [seconds the stream stays open]. Defaults to TIMEOUT.
+        idle (float, optional):     [seconds without page events]. Defaults to IDLE.
+
+    Yields:
+        bytes: [event stream chunks]
+    """
+    for pages, error in poll_pages(report_id, PAGE_FIELDS, None, poll, timeout, idle):
+        if error is not None:
+            yield event("timeout", {"report": report_id, "error": error})
+            return
+
+        for page in pages:
+            yield page_event(page)
+
+        if not pages:
+            yield b": keep-alive\n\n"
+
+    report = Report.objects.filter(pk=report_id).values(*REPORT_FIELDS).first()
+
+    if report is None:
+        yield event("failed", {"report": report_id, "error": "report removed"})
+    else:
+        yield event("done", dict(report, report=report_id))
@@ -0,0 +1,200 @@
+"""
+regions.py
+    version: 1.0
+
+Logic:
+    Detection post-processing stage that sits between YOLOV3 non max
+    suppression and table parsing. YOLOV3 boxes are padded and mapped into
+    pdf space in one vectorised pass (same correction as norm_bbox() and
+    bboxes_pdf() in predict_table.py), then:
+
+        1. regions overlapping by more than MERGE_OVERLAP of the smaller
+           region (incl. nested regions) are merged into their union
+        2. regions are clipped to the page cropBox
+        3. slivers narrower or shorter than MIN_WIDTH / MIN_HEIGHT points
+           are dropped
+
+    so each distinct table is parsed once, rather than once per overlapping
+    detection.
+
+    Regions are (N, 4) float arrays of x1, y1, x2, y2 where (x1, y1) is
+    left-top and (x2, y2) is right-bottom in pdf coordinate space.
+"""
+
+import numpy as np
+
+
+# share of the smaller region two regions must overlap by to be merged
+MERGE_OVERLAP = 0.5
+
+# smallest region kept, in pdf points
+MIN_WIDTH = 20.0
+MIN_HEIGHT = 10.0
+
+
+def pdf_regions(detections: np.ndarray, img_shape: tuple, page_size: tuple, x_corr=0.05) -> np.ndarray:
+    """
+    pad YOLOV3 image space boxes and map them into pdf space
+
+    Args:
+        detections (np.ndarray):    [(N, >=4) boxes x1, y1, x2, y2 in image pixels]
+        img_shape (tuple):          [page image shape (H, W, ...)]
+        page_size (tuple):          [pdf page (W, H)]
+        x_corr (float, optional):   [padding as share of box size]. Defaults to 0.05.
+
+    Returns:
+        np.ndarray: [(N, 4) regions in pdf space]
+    """
+    H_img, W_img = img_shape[:2]
+    W_pdf, H_pdf = page_size
+
+    if len(detections) == 0:
+        return np.empty((0, 4))
+
+    boxes = np.asarray(detections, dtype=float)[:, :4]
+    norm = boxes / np.array([W_img, H_img, W_img, H_img])
+
+    w_corr = (norm[:, 2] - norm[:, 0]) * x_corr
+    h_corr = (norm[:, 3] - norm[:, 1]) * x_corr
+    norm = norm + np.column_stack((-w_corr, -h_corr / 2, w_corr, 2 * h_corr))
+
+    return np.column_stack(
+        (
+            norm[:, 0] * W_pdf,
+            (1 - norm[:, 1]) * H_pdf,
+            norm[:, 2] * W_pdf,
+            (1 - norm[:, 3]) * H_pdf,
+        )
+    )
+
+
+def overlap_matrix(regions: np.ndarray) -> np.ndarray:
+    """
+    pairwise intersection area over the smaller region's area
+
+    Args:
+        regions (np.ndarray): [(N, 4) regions]
+
+    Returns:
+        np.ndarray: [(N, N) overlap ratios]
+    """
+    x1, y1, x2, y2 = regions.T
+    area = (x2 - x1) * (y1 - y2)
+
+    w = np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :])
+    h = np.minimum(y1[:, None], y1[None, :]) - np.maximum(y2[:, None], y2[None, :])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+
+    smaller = np.minimum(area[:, None], area[None, :])
+    return np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+
+
+def merge_groups(regions: np.ndarray, overlap=MERGE_OVERLAP) -> np.ndarray:
+    """
+    label regions by connected group of heavily overlapping regions
+
+    Args:
+        regions (np.ndarray):       [(N, 4) regions]
+        overlap (float, optional):  [merge threshold]. Defaults to MERGE_OVERLAP.
+
+    Returns:
+        np.ndarray: [(N,) group label per region, labels are 0..G-1]
+    """
+    linked = overlap_matrix(regions) >= overlap
+    np.fill_diagonal(linked, True)
+
+    # transitive closure, doubles path length each pass
+    reach = linked
+    while True:
+        grown = (reach.astype(int) @ reach.astype(int)) > 0
+        if (grown == reach).all():
+            break
+        reach = grown
+
+    _, labels = np.unique(reach.argmax(axis=1), return_inverse=True)
+    return labels
+
+
+def postprocess(regions: np.ndarray, page_size: tuple, scores=None, overlap=MERGE_OVERLAP, min_width=MIN_WIDTH, min_height=MIN_HEIGHT) -> tuple:
+    """
+    merge, clip and filter detected regions
+
+    Args:
+        regions (np.ndarray):           [(N, 4) regions in pdf space]
+        page_size (tuple):              [pdf page (W, H)]
+        scores (np.ndarray, optional):  [(N,) detection confidences]. Defaults to None.
+        overlap (float, optional):      [merge threshold]. Defaults to MERGE_OVERLAP.
+        min_width (float, optional):    [smallest width kept]. Defaults to MIN_WIDTH.
+        min_height (float, optional):   [smallest height kept]. Defaults to MIN_HEIGHT.
+
+    Returns:
+        tuple: [(M, 4) regions top to bottom, (M,) best confidence per region]
+    """
+    regions = np.asarray(regions, dtype=float).reshape(-1, 4)
+    scores = np.ones(len(regions)) if scores is None else np.asarray(scores, dtype=float)
+
+    if len(regions) == 0:
+        return regions, scores
+
+    # 1. merge overlapping and nested regions into their union
+    labels = merge_groups(regions, overlap)
+    n = labels.max() + 1
+
+    merged = np.empty((n, 4))
+    merged[:, [0, 3]] = np.inf
+    merged[:, [1, 2]] = -np.inf
+    np.minimum.at(merged[:, 0], labels, regions[:, 0])
+    np.maximum.at(merged[:, 1], labels, regions[:, 1])
+    np.maximum.at(merged[:, 2], labels, regions[:, 2])
+    np.minimum.at(merged[:, 3], labels, regions[:, 3])
+
+    best = np.full(n, -np.inf)
+    np.maximum.at(best, labels, scores)
+
+    # 2. clip to the page cropBox
+    W_pdf, H_pdf = page_size
+    merged[:, [0, 2]] = np.clip(merged[:, [0, 2]], 0, W_pdf)
+    merged[:, [1, 3]] = np.clip(merged[:, [1, 3]], 0, H_pdf)
+
+    # 3. drop slivers
+    keep = ((merged[:, 2] - merged[:, 0]) >= min_width) & (
+        (merged[:, 1] - merged[:, 3]) >= min_height
+    )
+    merged, best = merged[keep], best[keep]
+
+    order = np.argsort(-merged[:, 1], kind="stable")
+    return merged[order], best[order]
+
+
+def table_areas(regions: np.ndarray) -> list:
+    """
+    regions as camelot table_areas strings
+
+    Args:
+        regions (np.ndarray): [(N, 4) regions]
+
+    Returns:
+        list: ["x1,y1,x2,y2" strings]
+    """
+    return [",".join(str(v) for v in region) for region in regions.tolist()]
+
+
+def match_regions(regions: np.ndarray, bboxes: list) -> np.ndarray:
+    """
+    index of the region each parsed table came from
+
+    Args:
+        regions (np.ndarray):   [(N, 4) regions]
+        bboxes (list):          [parsed table _bbox tuples in camelot's order,
+                                 (x1, y1) left-bottom, (x2, y2) right-top]
+
+    Returns:
+        np.ndarray: [(T,) region index per parsed table]
+    """
+    if len(bboxes) == 0:
+        return np.empty(0, dtype=int)
+
+    boxes = np.asarray(bboxes, dtype=float)[:, [0, 3, 2, 1]]
+    dist = np.abs(boxes[:, None, :] - regions[None, :, :]).sum(axis=2)
+
+    return dist.argmin(axis=1)
@@ -0,0 +1,335 @@
+"""
+stream_parser.py
+    version: 1.1
+
+Logic:
+    Native alternative to camelot's 'stream' flavour for born-digital pages.
+    Glyph boxes are read once per page from the pdf text layer with pdfminer,
+    then for each table area found by YOLOV3 the glyphs inside the area are
+    clustered into rows, text segments and columns with numpy, and assembled
+    into a dataframe of string cells matching the shape camelot returns
+    (integer row index, integer column labels).
+
+    read_pdf() mirrors the camelot.read_pdf() call used in predict_table.py,
+    so either parser can be selected per job through Report.parser.
+
+Returns:
+    [list]: [StreamTable objects exposing .df and .parsing_report]
+"""
+
+import numpy as np
+import pandas as pd
+
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTChar, LTContainer
+
+
+class StreamTable:
+    """
+    parsed table container, exposes the same attributes predict_table.py
+    reads from a camelot Table
+    """
+
+    flavor = "stream"
+
+    def __init__(self, df, parsing_report, bbox):
+        self.df = df
+        self.parsing_report = parsing_report
+        self._bbox = bbox
+
+    def __repr__(self):
+        return f"<StreamTable shape={self.df.shape}>"
+
+
+def _walk_chars(layout_obj, chars: list) -> None:
+    """
+    recursively collect LTChar objects from a pdfminer layout tree
+
+    Args:
+        layout_obj ([LTComponent]): [pdfminer layout object]
+        chars (list):               [list to append found characters to]
+    """
+    for obj in layout_obj:
+        if isinstance(obj, LTChar):
+            chars.append(obj)
+        elif isinstance(obj, LTContainer):
+            _walk_chars(obj, chars)
+
+
+def text_layer(pdf_file: str, pg: int):
+    """
+    pdfminer layout of a pdf page, parsed once when more than one stage of
+    the page reads its text layer (see layout_cache.page_layout())
+
+    Args:
+        pdf_file (str): [path location of pdf file]
+        pg (int):       [page number, starting at 1]
+
+    Returns:
+        [LTPage]: [page layout]
+    """
+    return next(extract_pages(pdf_file, page_numbers=[pg - 1], laparams=LAParams()))
+
+
+def page_glyphs(pdf_file: str, pg: int, page=None) -> tuple:
+    """
+    read every non-blank glyph box from a pdf page text layer
+
+    Args:
+        pdf_file (str):             [path location of pdf file]
+        pg (int):                   [page number, starting at 1]
+        page (LTPage, optional):    [text_layer() of the page, parsed when None]. Defaults to None.
+
+    Returns:
+        tuple: [(N, 4) float array of x0, y0, x1, y1 in pdf space,
+                (N,) object array of glyph text]
+    """
+    if page is None:
+        page = text_layer(pdf_file, pg)
+
+    chars = []
+    _walk_chars(page, chars)
+
+    chars = [c for c in chars if c.get_text().strip()]
+
+    if not chars:
+        return np.empty((0, 4)), np.empty(0, dtype=object)
+
+    boxes = np.array([c.bbox for c in chars], dtype=float)
+    text = np.array([c.get_text() for c in chars], dtype=object)
+
+    return boxes, text
+
+
+def parse_area(area: str) -> list:
+    """
+    convert a camelot table_areas string into floats
+
+    Args:
+        area (str): ["x1,y1,x2,y2" where (x1, y1) is left-top and (x2, y2) is
+                      right-bottom in pdf coordinate space]
+
+    Returns:
+        list: [x1, y1, x2, y2]
+    """
+    return [float(v) for v in area.split(",")]
+
+
+def glyphs_in_area(boxes: np.ndarray, area: list) -> np.ndarray:
+    """
+    boolean mask of glyphs whose centre falls inside a table area
+
+    Args:
+        boxes (np.ndarray): [(N, 4) glyph boxes]
+        area (list):        [x1, y1, x2, y2 left-top, right-bottom]
+
+    Returns:
+        np.ndarray: [(N,) bool mask]
+    """
+    x1, y1, x2, y2 = area
+    xc = (boxes[:, 0] + boxes[:, 2]) / 2
+    yc = (boxes[:, 1] + boxes[:, 3]) / 2
+
+    return (xc >= x1) & (xc <= x2) & (yc <= y1) & (yc >= y2)
+
+
+def group_rows(boxes: np.ndarray, row_tol=0.5) -> np.ndarray:
+    """
+    cluster glyphs into text rows by vertical centre, a new row starts
+    wherever the gap between sorted centres exceeds row_tol * glyph height
+
+    Args:
+        boxes (np.ndarray):         [(N, 4) glyph boxes]
+        row_tol (float, optional):  [row break as fraction of median glyph
+                                     height]. Defaults to 0.5.
+
+    Returns:
+        np.ndarray: [(N,) row label per glyph, 0 is the top row]
+    """
+    yc = (boxes[:, 1] + boxes[:, 3]) / 2
+    height = np.median(boxes[:, 3] - boxes[:, 1])
+
+    order = np.argsort(-yc, kind="stable")
+    breaks = np.diff(yc[order]) < -row_tol * height
+
+    rows = np.empty(len(yc), dtype=int)
+    rows[order] = np.concatenate(([0], np.cumsum(breaks)))
+
+    return rows
+
+
+def group_segments(boxes: np.ndarray, text: np.ndarray, rows: np.ndarray, seg_gap=0.8, space_gap=0.15) -> tuple:
+    """
+    join glyphs of the same row into text segments, a segment is broken by a
+    horizontal gap wider than seg_gap * glyph height (column gutter), single
+    spaces are restored where the gap is wider than space_gap * glyph height
+
+    Args:
+        boxes (np.ndarray):             [(N, 4) glyph boxes]
+        text (np.ndarray):              [(N,) glyph text]
+        rows (np.ndarray):              [(N,) row label per glyph]
+        seg_gap (float, optional):      [segment break]. Defaults to 0.8.
+        space_gap (float, optional):    [word break]. Defaults to 0.15.
+
+    Returns:
+        tuple: [(S, 4) segment boxes, (S,) segment text, (S,) segment row]
+    """
+    height = np.median(boxes[:, 3] - boxes[:, 1])
+
+    order = np.lexsort((boxes[:, 0], rows))
+    boxes, text, rows = boxes[order], text[order], rows[order]
+
+    gap = boxes[1:, 0] - boxes[:-1, 2]
+    new_row = rows[1:] != rows[:-1]
+    starts = np.flatnonzero(np.concatenate(([True], new_row | (gap > seg_gap * height))))
+    ends = np.append(starts[1:], len(rows))
+
+    # insert a space in front of glyphs following a word gap
+    spaced = np.concatenate(([False], (gap > space_gap * height) & ~new_row))
+    text = text.astype(str)
+    text = np.where(spaced, np.char.add(" ", text), text)
+    seg_text = np.array(["".join(text[s:e]).strip() for s, e in zip(starts, ends)], dtype=object)
+
+    seg_boxes = np.column_stack(
+        (
+            np.minimum.reduceat(boxes[:, 0], starts),
+            np.minimum.reduceat(boxes[:, 1], starts),
+            np.maximum.reduceat(boxes[:, 2], starts),
+            np.maximum.reduceat(boxes[:, 3], starts),
+        )
+    )
+
+    return seg_boxes, seg_text, rows[starts]
+
+
+def group_columns(seg_boxes: np.ndarray, seg_rows: np.ndarray) -> tuple:
+    """
+    cluster text segments into columns. Column intervals are seeded from the
+    rows holding the most common number of segments (as camelot does, so a
+    header spanning several columns does not merge them), overlapping seed
+    intervals are merged, and every segment is then assigned by its centre
+    to the nearest column split at the gutters between intervals
+
+    Args:
+        seg_boxes (np.ndarray): [(S, 4) segment boxes]
+        seg_rows (np.ndarray):  [(S,) segment row labels]
+
+    Returns:
+        tuple: [(S,) column label per segment, (C - 1,) gutter x positions]
+    """
+    counts = np.bincount(seg_rows)
+    multi = counts[counts > 1]
+    mode = np.bincount(multi).argmax() if len(multi) else 1
+
+    seed = np.isin(seg_rows, np.flatnonzero(counts == mode))
+    x0, x1 = seg_boxes[seed, 0], seg_boxes[seed, 2]
+
+    order = np.argsort(x0)
+    x0, x1 = x0[order], x1[order]
+    reach = np.maximum.accumulate(x1)
+    new_col = np.concatenate(([True], x0[1:] > reach[:-1]))
+
+    col_left = x0[new_col]
+    col_right = np.maximum.reduceat(x1, np.flatnonzero(new_col))
+    gutters = (col_right[:-1] + col_left[1:]) / 2
+
+    xc = (seg_boxes[:, 0] + seg_boxes[:, 2]) / 2
+
+    return np.searchsorted(gutters, xc), gutters
+
+
+def build_frame(seg_text: np.ndarray, seg_rows: np.ndarray, seg_cols: np.ndarray, n_rows: int, n_cols: int):
+    """
+    assemble segments into a dataframe of string cells, segments sharing a
+    cell are joined with a space
+
+    Args:
+        seg_text (np.ndarray):  [(S,) segment text]
+        seg_rows (np.ndarray):  [(S,) row labels]
+        seg_cols (np.ndarray):  [(S,) column labels]
+        n_rows (int):           [number of table rows]
+        n_cols (int):           [number of table columns]
+
+    Returns:
+        [dataframe]: [n_rows x n_cols table of strings]
+    """
+    cells = pd.DataFrame({"row": seg_rows, "col": seg_cols, "text": seg_text})
+    df = cells.groupby(["row", "col"], sort=True)["text"].agg(" ".join).unstack("col")
+    df = df.reindex(index=range(n_rows), columns=range(n_cols)).fillna("")
+    df.index.name = None
+    df.columns.name = None
+
+    return df
+
+
+def parse_table(boxes: np.ndarray, text: np.ndarray, area: list, order=1, page=1):
+    """
+    parse the glyphs inside one table area into a StreamTable
+
+    Args:
+        boxes (np.ndarray):     [(N, 4) glyph boxes for the page]
+        text (np.ndarray):      [(N,) glyph text for the page]
+        area (list):            [x1, y1, x2, y2 left-top, right-bottom]
+        order (int, optional):  [table order on page]. Defaults to 1.
+        page (int, optional):   [page number]. Defaults to 1.
+
+    Returns:
+        [StreamTable]: [parsed table, None if the area holds no text]
+    """
+    mask = glyphs_in_area(boxes, area)
+    if not mask.any():
+        return None
+
+    boxes, text = boxes[mask], text[mask]
+
+    rows = group_rows(boxes)
+    _, rows = np.unique(rows, return_inverse=True)
+    seg_boxes, seg_text, seg_rows = group_segments(boxes, text, rows)
+    seg_cols, gutters = group_columns(seg_boxes, seg_rows)
+
+    n_rows, n_cols = seg_rows.max() + 1, len(gutters) + 1
+    df = build_frame(seg_text, seg_rows, seg_cols, n_rows, n_cols)
+
+    # accuracy: share of segments that do not spill across a column gutter
+    spill = np.searchsorted(gutters, seg_boxes[:, 0]) != np.searchsorted(gutters, seg_boxes[:, 2])
+    whitespace = (df.values == "").sum() / df.size
+
+    parsing_report = {
+        "accuracy": round(float(100 * (1 - spill.mean())), 2),
+        "whitespace": round(float(100 * whitespace), 2),
+        "order": order,
+        "page": page,
+    }
+
+    # bbox in camelot's order, (x1, y1) left-bottom, (x2, y2) right-top
+    x1, y1, x2, y2 = area
+    return StreamTable(df, parsing_report, (x1, y2, x2, y1))
+
+
+def read_pdf(filepath: str, pages: str, table_areas: list, glyphs=None, **kwargs) -> list:
+    """
+    stream-parse table areas on a single pdf page, mirrors the camelot
+    read_pdf() call made by predict_table.py
+
+    Args:
+        filepath (str):             [path location of pdf file]
+        pages (str):                [page number to parse]
+        table_areas (list):         [camelot style "x1,y1,x2,y2" strings]
+        glyphs (tuple, optional):   [pre-read page_glyphs() output]. Defaults to None.
+
+    Returns:
+        list: [StreamTable objects, one per area holding text]
+    """
+    pg = int(pages)
+    boxes, text = glyphs if glyphs is not None else page_glyphs(filepath, pg)
+
+    tables = []
+    if len(boxes) == 0:
+        return tables
+
+    for area in table_areas:
+        table = parse_table(boxes, text, parse_area(area), order=len(tables) + 1, page=pg)
+        if table is not None:
+            tables.append(table)
+
+    return tables
@@ -11,7 +11,7 @@ Logic:
     and export to file output_types. Once whole document has been processed
     by YOLOV3, any exported files will then be added to the database Extracted
     and referenced to the file database
-    object Report, along with a zip of the csv directory.
+    object Report. The csv zip is streamed on download (see zip_stream.py).
 
 Additional:
     Utilises multi-processing for detection and extraction.
@@ -32,27 +32,32 @@ Raises:
     AttributeError:     [when file is not a pdf]
 
 Returns:
-    dict: [containing pdf and extracted tables info]
+    dict: [containing pdf and extracted tables info, incl. pages that ran
+           over the EXTRACTION_PAGE_TIMEOUT / EXTRACTION_JOB_TIMEOUT budgets]
 """
 
 import os
-import shutil
 import pandas as pd
 import json
 import filecmp
-import multiprocessing as mp
+import queue
 
 from pathlib import Path, PurePath
 from tabulate import tabulate
 from PyPDF2 import PdfFileReader
+from timeit import default_timer as timer
 
+from django.conf import settings
+from django.db import transaction
+
+from api.scripts import exports, worker_pool, blob_store, zip_stream
 from api.scripts.logging import Logging
-from api.models import Report
-from api.scripts.YOLOV3.predict_table import detect_tables
+from api.models import Report, Page, Table, Extracted
+from api.scripts.YOLOV3.predict_table import run_page, remove_page_outputs
 
 
-# camelot accuracy report list
-report_list = []
+# default seconds to wait for the workers to confirm the writes of a job's pages
+WRITE_TIMEOUT = 60
 
 
 def pdf_stats(
@@ -199,22 +204,153 @@ def collect_result(filename: str, table: dict, tables_list) -> None:
     return None
 
 
-def collect_parsing_report(report: list) -> None:
+def write_exports(exporters: list, result: dict) -> None:
+    """
+    hand a confirmed page result's tables to the report level exporters,
+    errors are logged rather than failing the job
+
+    Args:
+        exporters (list):   [ReportExporter instances]
+        result (dict):      [page result incl. its tables]
+
+    Returns: None
+    """
+    for exporter in exporters:
+        try:
+            exporter.add_page(result["page"], result["tables"])
+        except Exception as e:
+            Logging().output(
+                "ERROR", f"{exporter.export_type} export of page {result['page']}: {e}"
+            )
+
+    return None
+
+
+def collect_parsing_report(result: dict, report_list: list) -> None:
     """
     collector function for grabbing multi-processing outputs,
-    appends outputs to report_list
+    appends outputs to the job's report_list
 
     Args:
-        report (list): camelot parsing report stats
+        result (dict):      page status and camelot parsing report stats
+        report_list (list): page results of the job
 
     Returns: None
     """
-    if report:
-        report_list.append(report)
+    if result:
+        report_list.append(result)
 
     return None
 
 
+def save_extracted(report_db: Report, outputs: list, extract_dir: dict) -> int:
+    """
+    save the Extracted instances of a job's tables, one per output type, and
+    their blob references in a single transaction
+
+    Args:
+        report_db (Report): [report database object]
+        outputs (list):     [table output descriptors returned by the workers]
+        extract_dir (dict): [output type: directory path]
+
+    Returns:
+        int: [Extracted instances saved]
+    """
+    sizes = {o["digest"]: o["size"] for o in outputs}
+    refs = {}
+    for o in outputs:
+        refs[o["digest"]] = refs.get(o["digest"], 0) + len(extract_dir)
+
+    batch_size = getattr(settings, "EXTRACTION_BULK_BATCH", 500)
+
+    # Table instances are saved by the workers' writers, confirmed by now
+    tables = {
+        (page, num): pk
+        for pk, page, num in Table.objects.filter(
+            report=report_db, table_num__isnull=False
+        ).values_list("pk", "page_num", "table_num")
+    }
+
+    with transaction.atomic():
+        blobs = blob_store.link(sizes, refs)
+
+        extracted = Extracted.objects.bulk_create(
+            (
+                Extracted(
+                    report=report_db,
+                    table_id=tables.get((o["page"], o["table_num"])),
+                    blob_id=blobs[o["digest"]],
+                    file=blob_store.output_name(o["digest"], f_type),
+                    f_type=f_type,
+                    page_num=o["page"],
+                    table_num=o["table_num"],
+                )
+                for o in sorted(outputs, key=lambda o: (o["page"], o["table_num"]))
+                for f_type in extract_dir
+            ),
+            batch_size=batch_size,
+        )
+
+    # bulk_create sends no post_save, drop the cached zip members here
+    zip_stream.invalidate(report_db)
+
+    # blobs reserved by jobs that never linked them (dropped pages, failures)
+    blob_store.sweep()
+
+    return len(extracted)
+
+
+def wait_for_pages(pages: dict, job_timeout=None) -> list:
+    """
+    wait for page results within the job time budget
+
+    Args:
+        pages (dict):                   [page number: AsyncResult]
+        job_timeout (int, optional):    [job budget in seconds]. Defaults to None.
+
+    Returns:
+        list: [page numbers still running when the budget ran out]
+    """
+    deadline = None if job_timeout is None else timer() + job_timeout
+
+    for result in pages.values():
+        remaining = None if deadline is None else max(deadline - timer(), 0)
+        result.wait(remaining)
+
+    return [num for num, result in pages.items() if not result.ready()]
+
+
+def wait_for_writes(written, page_numbers: list, timeout=WRITE_TIMEOUT) -> dict:
+    """
+    wait for the workers' write behind queues to confirm the writes of pages
+
+    Args:
+        written (mp.Queue):         [job results queue, (page, error) per page]
+        page_numbers (list):        [pages returned by the workers]
+        timeout (float, optional):  [seconds to wait for all confirmations]. Defaults to WRITE_TIMEOUT.
+
+    Returns:
+        dict: [page number: write error, for pages with failed or unconfirmed writes]
+    """
+    pending = set(page_numbers)
+    errors = {}
+
+    deadline = timer() + timeout
+
+    while pending:
+        try:
+            page, error = written.get(timeout=max(deadline - timer(), 0))
+        except queue.Empty:
+            errors.update({num: "writes not confirmed" for num in pending})
+            break
+
+        pending.discard(page)
+        if error is not None:
+            errors[page] = error
+
+    return errors
+
+
 def process_extracted_file(
     filename: str, tables_list: list, full_working_dir: str
 ) -> None:
@@ -376,22 +512,10 @@ def extract(file_path: str, start_page: int, end_page: int) -> dict:
     report_db.start_page = start_at
     report_db.save()
 
-    # set directory test bool
-    dir_created = False
-
-    # build extraction directory names
-    extract_dir = {
-        "csv": PurePath(full_working_dir, "csv"),
-        "json": PurePath(full_working_dir, "json"),
-    }
-
-    # create new folders for storing to be extracted files.
-    for dir in extract_dir.values():
-        Path(dir).mkdir(parents=True, exist_ok=True)
-        dir_created = True
+    # build extraction directory names, create new folders for storing to be extracted files.
+    extract_dir = build_extract_dir(full_working_dir)
 
-    if dir_created:
-        log.output("INFO", "export directories created")
+    log.output("INFO", "export directories created")
 
     # get pdf stats
     pdf_info = pdf_stats(
@@ -400,82 +524,323 @@ def extract(file_path: str, start_page: int, end_page: int) -> dict:
 
     log.output("INFO", f"processing pdf stats \n{pdf_info}")
 
-    # Multi-processing 1: Init multiprocessing Pool
-    pool = mp.Pool(mp.cpu_count())
-
-    log.output("INFO", f"multiprocessing using {mp.cpu_count()} cpu cores")
-
-    # Multi-processing 2: Use async to loop to parallelize YOLOV3
-    # Note: apply_async returns an unordered list
     try:
         log.output("INFO", f"starting extractions for pages {start_at} to {end_at}...")
-        for num in range(start_at, end_at + 1, 1):
-            detection_objects = pool.apply_async(
-                detect_tables,
-                (str(file_path), num, "all", report_db, extract_dir),
-                callback=collect_parsing_report,
-            )
-    except Exception as e:
-        error_msg = "".join(["from predict_tably.py: ", str(e)])
+        run = process_pages(
+            file_path, range(start_at, end_at + 1, 1), report_db, extract_dir
+        )
+    except SystemError:
         report_db.delete()
         log.output("INFO", "removed database object")
-        raise SystemError(error_msg)
+        raise
+
+    # return dictionary for front-end
+    return finish_extraction(file_path, report_db, extract_dir, start_page, end_at, run)
+
+
+def reparse(report_db: Report, parser: str) -> dict:
+    """
+    re-runs only the parsing stage of an extracted report, using the table
+    regions stored by its detection run and the given parser. Replaces the
+    report's previous exports. Only pages with stored detections are parsed.
+
+    Args:
+        report_db (Report): [report database object]
+        parser (str):       [Report.PARSER_CHOICES parser to parse with]
+
+    Raises:
+        ValueError:         [when parser is not a known parser]
+        FileNotFoundError:  [when the report document is missing]
+        SystemError:        [when exception is thrown by extraction engine]
 
-    # Multi-processing 3: Don't forget to close
-    pool.close()
+    Returns:
+        dict: [containing pdf and extracted tables info]
+    """
+
+    # create log object
+    log = Logging()
+
+    if parser not in dict(Report.PARSER_CHOICES):
+        error_msg = f"parser {parser} not available, choose from: {list(dict(Report.PARSER_CHOICES))}"
+        raise ValueError(error_msg)
+
+    file_path = report_db.document.path
+
+    if not Path(file_path).is_file():
+        error_msg = f"{PurePath(file_path).name} not found!"
+        raise FileNotFoundError(error_msg)
+
+    report_db.parser = parser
+    report_db.save()
+
+    extract_dir = build_extract_dir(Path(file_path).parent)
+
+    pages = sorted(set(report_db.tables.values_list("page_num", flat=True)))
+
+    log.output("INFO", f"re-parsing {len(pages)} pages with parser: {parser}")
+
+    run = process_pages(file_path, pages, report_db, extract_dir, reparse=True)
+
+    return finish_extraction(
+        file_path,
+        report_db,
+        extract_dir,
+        report_db.start_page,
+        report_db.end_page,
+        run,
+        reparse=True,
+    )
+
+
+def build_extract_dir(full_working_dir) -> dict:
+    """
+    build extraction directory names of the per table output types, the
+    table files themselves live in the shared blob store (see
+    api/scripts/blob_store.py) so no folders are created
+
+    Args:
+        full_working_dir (str): [the working directory of the Report]
+
+    Returns:
+        dict: [output type: directory path]
+    """
+    extract_dir = {
+        "csv": PurePath(full_working_dir, "csv"),
+        "json": PurePath(full_working_dir, "json"),
+        "xlsx": PurePath(full_working_dir, "xlsx"),
+    }
 
-    # Multi-processing 4: wait until process queue is empty.
-    pool.join()
+    return extract_dir
 
-    log.output("INFO", "finished extracting")
 
-    # testing camelot parsing report
-    # ==============================
-    acc_total = 0
-    count = 0
+def process_pages(file_path: str, page_numbers, report_db: Report, extract_dir: dict, reparse=False) -> list:
+    """
+    runs pages through the worker pool within the page and job time budgets
 
-    # collect total accuracy and count cases
-    for report in report_list:
-        count += 1
-        acc_total += report[0]["accuracy"]
+    Args:
+        file_path (str):            [path location of pdf file]
+        page_numbers (iterable):    [pages to process]
+        report_db (Report):         [report database object]
+        extract_dir (dict):         [output type: directory path]
+        reparse (bool, optional):   [only re-run the parsing stage]. Defaults to False.
 
-    # empty list
-    report_list.clear()
+    Raises:
+        SystemError:        [when exception is thrown by extraction engine]
 
-    # get average accuracy and log to console
-    if count > 0:
-        acc_avg = acc_total / count
-        log.output(
-            "DEBUG", f"camelot parsing report accuracy avg: {round(acc_avg, 2)}%"
+    Returns:
+        dict: [tables found, pages with tables, pages processed, job
+               seconds, pages that timed out, write errors per page, pages
+               per detection stage and report level export paths]
+    """
+
+    # create log object
+    log = Logging()
+
+    # start stopwatch, job time is kept on the report
+    start = timer()
+
+    # report level exports, written once the pages' writes are confirmed
+    try:
+        exporters = exports.open_exporters(
+            report_db.export_types(), Path(file_path).parent
         )
-    # ==============================
+    except ImportError as e:
+        raise SystemError(f"export dependency missing: {e}")
 
-    log.output("INFO", "collecting table data for HTTP response...")
+    # page results of this job, status and camelot accuracy reports per page
+    report_list = []
 
-    # loop through extraction directories:
-    for key, value in extract_dir.items():
-        if key == "csv":
-            zip_name = original_file_name.replace(".pdf", "-CSV")
-            zip_path = PurePath(full_working_dir, zip_name)
+    # time budgets, per page inside each worker and for the whole job here
+    page_timeout = getattr(settings, "EXTRACTION_PAGE_TIMEOUT", None)
+    job_timeout = getattr(settings, "EXTRACTION_JOB_TIMEOUT", None)
 
-            # create zip of csv extraction directory
-            shutil.make_archive(
-                zip_path, "zip", Path(full_working_dir), Path(value).name
-            )
+    # always bounded, pages whose writes are not confirmed in time are failed
+    write_timeout = getattr(settings, "EXTRACTION_WRITE_TIMEOUT", None) or WRITE_TIMEOUT
+
+    # workers only need the report's id and extraction settings, not the
+    # whole instance pickled into every task
+    task_report = Report.objects.only("id", "parser", "detector", "exports").get(pk=report_db.pk)
+
+    try:
+        # Multi-processing 1: take the shared warm pool, every worker writes its
+        # tables from a write behind queue and confirms each page's writes on the
+        # pool's written queue
+        with worker_pool.job() as workers:
+            pool, written = workers.pool, workers.written
+
+            log.output("INFO", f"multiprocessing using {workers.size} worker processes")
+
+            # Multi-processing 2: Use async to loop to parallelize YOLOV3
+            # Note: apply_async returns an unordered list
+            pages = {}
+            try:
+                for num in page_numbers:
+                    pages[num] = pool.apply_async(
+                        run_page,
+                        (str(file_path), num, "all", task_report, extract_dir, page_timeout, reparse),
+                        callback=lambda result: collect_parsing_report(result, report_list),
+                    )
+            except Exception as e:
+                worker_pool.restart("pages could not be queued")
+                error_msg = "".join(["from predict_tably.py: ", str(e)])
+                raise SystemError(error_msg)
+
+            # Multi-processing 3: wait until every page is back or job budget is spent.
+            unfinished = wait_for_pages(pages, job_timeout)
+
+            # flush: pages returned by the workers still need their writes confirmed
+            write_errors = {}
+            if workers.write_queue:
+                returned = [num for num, result in pages.items() if result.ready() and result.successful()]
+                write_errors = wait_for_writes(written, returned, write_timeout)
+
+            for num, error in sorted(write_errors.items()):
+                log.output("ERROR", f"page {num} writes failed: {error}")
+
+            # pages over the page budget were stopped inside their worker, recycle the
+            # workers; pages still running at the job budget are stopped with them,
+            # as are pages whose confirmations may still arrive
+            timed_out = [r["page"] for r in report_list if r["status"] == "timed out"]
+            crashed = [num for num, result in pages.items() if result.ready() and not result.successful()]
+
+            if unfinished or timed_out or write_errors or crashed:
+                worker_pool.restart("pages stopped or writes unconfirmed")
+
+                for num in unfinished:
+                    remove_page_outputs(str(file_path), num, report_db, extract_dir)
+                    Page.objects.update_or_create(
+                        report=report_db, page_num=num, defaults={"status": "timed out", "tables": 0}
+                    )
+
+                # pages with failed writes are dropped whole
+                for num in write_errors:
+                    remove_page_outputs(str(file_path), num, report_db, extract_dir)
+                    Page.objects.update_or_create(
+                        report=report_db, page_num=num, defaults={"status": "failed", "tables": 0}
+                    )
+
+                timed_out = sorted(timed_out + unfinished)
+                if timed_out:
+                    log.output("WARNING", f"pages timed out: {timed_out}")
+
+            log.output("INFO", "finished extracting")
+
+            # the job's results are read before the pool is handed to the next job
+
+            # testing camelot parsing report
+            # ==============================
+            acc_total = 0
+            count = 0
+
+            # collect total accuracy and count cases
+            for result in report_list:
+                for report in result["report"]:
+                    count += 1
+                    acc_total += report["accuracy"]
+
+            # table outputs of the pages whose writes are all in, saved in one go
+            done = [
+                result
+                for result in report_list
+                if result["status"] == "ok" and result["page"] not in write_errors
+            ]
+            outputs = [o for result in done for o in result["extracted"]]
+            saved = save_extracted(report_db, outputs, extract_dir)
+            log.output("INFO", f"saved {saved} extracted outputs")
+
+            # detection routing, pages per stage that produced their regions
+            routing = {}
+            for result in report_list:
+                stage = " ".join(filter(None, (result["detector"], result["model"])))
+                if stage:
+                    routing[stage] = routing.get(stage, 0) + 1
+
+            # get average accuracy and log to console, per table reports are kept in Table
+            if count > 0:
+                acc_avg = acc_total / count
+                log.output(
+                    "DEBUG", f"camelot parsing report accuracy avg: {round(acc_avg, 2)}%"
+                )
+            # ==============================
+
+            if routing:
+                log.output(
+                    "DEBUG",
+                    f"detection routing \n{tabulate(sorted(routing.items()), tablefmt='fancy_grid')}",
+                )
+
+        # report level exports of the saved pages, in page order, once the
+        # pool is handed on
+        for result in sorted(done, key=lambda r: r["page"]):
+            write_exports(exporters, result)
+    finally:
+        # exporters are closed when the job fails too
+        exported = {e.export_type: e.close() for e in exporters}
+
+    return {
+        "tables found": len(outputs),
+        "pages with tables": len({o["page"] for o in outputs}),
+        "pages processed": len(done),
+        "processing seconds": round(timer() - start, 2),
+        "pages timed out": timed_out,
+        "write errors": write_errors,
+        "detection stages": routing,
+        "exports": exported,
+    }
 
-            log.output("INFO", f'{"".join([zip_name,".zip"])} created')
 
-            number_of_tables = 0
+def finish_extraction(
+    file_path: str,
+    report_db: Report,
+    extract_dir: dict,
+    start_page: int,
+    end_at: int,
+    run: dict,
+    reparse=False,
+) -> dict:
+    """
+    records the job's aggregates on the report, cleans up and builds the
+    response, the csv zip is only built when downloaded
 
-            # count table files
-            for path in Path(value).iterdir():
-                if path.is_file():
-                    number_of_tables += 1
+    Args:
+        file_path (str):    [path location of pdf file]
+        report_db (Report): [report database object]
+        extract_dir (dict): [output type: directory path]
+        start_page (int):   [extraction starting page]
+        end_at (int):       [extraction ending page]
+        run (dict):         [process_pages() summary]
+        reparse (bool, optional):   [the job re-parsed stored detections]. Defaults to False.
 
-    log.output("INFO", "finished collecting table data for HTTP response")
+    Returns:
+        dict: [containing pdf and extracted tables info]
+    """
 
-    # save zip file to database
-    report_db.zip_csv.name = str(PurePath(full_working_dir.name, zip_name)) + ".zip"
+    # create log object
+    log = Logging()
+
+    full_working_dir = Path(file_path).parent
+
+    number_of_tables = run["tables found"]
+
+    # aggregates kept on the report, so listing reports needs no counting.
+    # Only pages with detections are re-parsed, the tables of a re-parse are
+    # all of the report's tables; processing time adds up over all jobs
+    report_db.tables_found = number_of_tables
+    report_db.pages_with_tables = run["pages with tables"]
+    if not reparse:
+        report_db.pages_processed = run["pages processed"]
+    report_db.processing_seconds += run["processing seconds"]
+
+    # save consolidated table files to database, each served as a single file
+    if "ndjson" in run["exports"]:
+        report_db.ndjson.name = run["exports"]["ndjson"]
+    if "xlsx" in run["exports"]:
+        report_db.xlsx.name = run["exports"]["xlsx"]
+    if "parquet" in run["exports"]:
+        report_db.parquet = run["exports"]["parquet"]
+        report_db.parquet_pages = exports.parquet_pages(
+            Path(settings.MEDIA_ROOT, report_db.parquet)
+        )
     report_db.save()
 
     log.output("INFO", "database updated")
@@ -493,9 +858,11 @@ def extract(file_path: str, start_page: int, end_page: int) -> dict:
         "total pages": report_db.total_pages,
         "start page": start_page,
         "end page": end_at,
+        "parser": report_db.parser,
+        "detector": report_db.detector,
         "output types": "{}".format(list(extract_dir.keys())),
-        "tables found": number_of_tables,
     }
+    response.update(run)
 
     # get pdf stats
     pdf_info = pdf_stats(
@@ -509,9 +876,7 @@ def extract(file_path: str, start_page: int, end_page: int) -> dict:
 
     log.output("INFO", f"processed pdf stats \n{pdf_info}")
 
-    # return dictionary for front-end
     return response
 
-
 if __name__ == "__main__":
     extract()
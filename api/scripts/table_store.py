@@ -0,0 +1,254 @@
+"""
+table_store.py
+    version: 1.0
+
+Logic:
+    One canonical stored copy of every distinct extracted table, with the
+    per table output formats (csv, json, xlsx) materialized from it on first
+    request.
+
+    Tables are kept in the content addressed blob store (blob_store.py).
+    Workers write each new valid table once, as a cell matrix at
+    blobs/<xx>/<digest>.cells.json.gz, and record an Extracted instance for
+    every output format pointing at where that format will live
+    (blobs/<xx>/<digest>.<format>). The media view and the zip download call
+    materialize() for files that do not exist yet; the generated file is
+    then served from disk like any other media file.
+
+    Canonical files are gzip compressed, and so are the csv and json output
+    files when EXTRACTION_COMPRESS_OUTPUTS is set: they are stored as
+    <digest>.<format>.gz beside the path recorded on Extracted, and the media
+    view serves them with Content-Encoding: gzip, or decompressed for clients
+    that do not accept it. xlsx files are zip archives already.
+
+    Tables whose compact json cell matrix is at most EXTRACTION_INLINE_CELLS
+    bytes are stored inline on their Table instance instead of a canonical
+    file, so reading them (cells() and the extracted cells endpoint) needs
+    no filesystem access at all.
+
+Returns:
+    [Path]: [materialized output file]
+"""
+
+import os
+import gzip
+import json
+import threading
+
+import pandas as pd
+
+from pathlib import Path
+
+from django.conf import settings
+
+from api.scripts import blob_store
+
+
+CANONICAL_SUFFIX = ".cells.json.gz"
+
+# output formats stored gzip compressed, suffix of compressed files
+COMPRESSED_FORMATS = ("csv", "json")
+GZIP_SUFFIX = ".gz"
+
+# default largest compact json cell matrix, in bytes, stored inline on Table
+INLINE_CELLS = 16 * 1024
+
+
+def canonical_path(key: str) -> Path:
+    """
+    canonical file of a table
+
+    Args:
+        key (str): [Blob.digest of the table]
+
+    Returns:
+        Path: [canonical table file]
+    """
+    return Path(settings.MEDIA_ROOT, blob_store.blob_dir(key), key + CANONICAL_SUFFIX)
+
+
+def cell_matrix(df: pd.DataFrame) -> list:
+    """
+    table cells as a list of rows of str, the stored form of a table
+    """
+    return df.fillna("").astype(str).values.tolist()
+
+
+def inline_cells(df: pd.DataFrame):
+    """
+    cell matrix of a table small enough to be stored inline on its Table
+
+    Args:
+        df (pd.DataFrame): [parsed table]
+
+    Returns:
+        [list]: [cell matrix, None when over the EXTRACTION_INLINE_CELLS size
+                 and the table needs a canonical file]
+    """
+    limit = getattr(settings, "EXTRACTION_INLINE_CELLS", INLINE_CELLS)
+    if not limit:
+        return None
+
+    cells = cell_matrix(df)
+    if len(blob_store.encode(cells)) > limit:
+        return None
+
+    return cells
+
+
+def partial_path(path: Path) -> Path:
+    """
+    hidden file beside path to write it under before it is moved into place,
+    one per process and thread so concurrent writers never share one
+    """
+    return path.with_name(f".{os.getpid()}-{threading.get_ident()}-{path.name}")
+
+
+def write(path: Path, df: pd.DataFrame) -> None:
+    """
+    store a table's cells as its canonical file
+
+    Args:
+        path (Path):        [canonical_path() of the table]
+        df (pd.DataFrame):  [parsed table]
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # workers storing the same table at once each replace a whole file
+    partial = partial_path(path)
+    try:
+        with gzip.open(partial, "wt", encoding="utf-8") as f:
+            json.dump(cell_matrix(df), f)
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+
+    return None
+
+
+def read(path: Path) -> pd.DataFrame:
+    """
+    load a table from its canonical file
+
+    Args:
+        path (Path): [canonical_path() of the table]
+
+    Returns:
+        pd.DataFrame: [table cells, integer row index and column labels]
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return pd.DataFrame(json.load(f))
+
+
+def render(df: pd.DataFrame, path: Path, f_type: str, compression=None) -> None:
+    """
+    write a table in one output format, same layouts as the eager exports had
+
+    Args:
+        df (pd.DataFrame):              [table]
+        path (Path):                    [output file]
+        f_type (str):                   [output format, csv, json or xlsx]
+        compression (str, optional):    [csv and json file compression]. Defaults to None.
+    """
+    if f_type == "csv":
+        df.to_csv(str(path), index=False, compression=compression)
+    elif f_type == "json":
+        df.to_json(str(path), orient="columns", compression=compression)
+    elif f_type == "xlsx":
+        df.to_excel(str(path), index=False, engine="xlsxwriter")
+    else:
+        raise ValueError(f"unknown table output format {f_type}")
+
+    return None
+
+
+def source_path(extracted) -> Path:
+    """
+    canonical file of an Extracted instance's table
+
+    blobs/<xx>/<digest>.<format> -> blobs/<xx>/<digest>.cells.json.gz
+    """
+    output = Path(settings.MEDIA_ROOT, str(extracted.file))
+
+    return output.with_name(output.stem + CANONICAL_SUFFIX)
+
+
+def cells(extracted) -> list:
+    """
+    cell matrix of an Extracted instance's table, from the inline cells of
+    its Table or else its canonical file
+
+    Args:
+        extracted (Extracted): [extraction database object, table selected]
+
+    Raises:
+        FileNotFoundError:  [when the table has neither]
+
+    Returns:
+        list: [rows of cell str]
+    """
+    if extracted.table is not None and extracted.table.cells is not None:
+        return extracted.table.cells
+
+    source = source_path(extracted)
+    if not source.exists():
+        raise FileNotFoundError(f"{source.name} not found!")
+
+    with gzip.open(source, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def stored_path(extracted) -> Path:
+    """
+    file an Extracted instance's output is stored at, the recorded path or
+    its gzip compressed sibling when the format is compressed at rest
+    """
+    output = Path(settings.MEDIA_ROOT, str(extracted.file))
+
+    if output.exists():
+        return output
+
+    compressed = output.with_name(output.name + GZIP_SUFFIX)
+    if compressed.exists() or (
+        extracted.f_type in COMPRESSED_FORMATS
+        and getattr(settings, "EXTRACTION_COMPRESS_OUTPUTS", False)
+    ):
+        return compressed
+
+    return output
+
+
+def materialize(extracted) -> Path:
+    """
+    generate an Extracted output file from its stored table, unless it
+    already exists
+
+    Args:
+        extracted (Extracted): [extraction database object]
+
+    Raises:
+        FileNotFoundError:  [when the stored table is missing]
+
+    Returns:
+        Path: [output file, stored_path()]
+    """
+    output = stored_path(extracted)
+
+    if output.exists():
+        return output
+
+    df = pd.DataFrame(cells(extracted))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    # write beside the final name so concurrent requests never serve a partial
+    # file, the suffix is kept for writers that check it
+    partial = partial_path(output)
+    compression = "gzip" if output.suffix == GZIP_SUFFIX else None
+    try:
+        render(df, partial, extracted.f_type, compression)
+        os.replace(partial, output)
+    finally:
+        partial.unlink(missing_ok=True)
+
+    return output
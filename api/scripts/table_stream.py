@@ -0,0 +1,216 @@
+"""
+table_stream.py
+    version: 1.2
+
+Logic:
+    Streamed uploads (api/upload/?stream=ndjson). The upload queues its job
+    for the extraction worker as usual and its response is a chunked ndjson
+    stream of the job's tables, read back from the database as the worker
+    finishes pages: a first line with the job and report ids, one line per
+    table of every finished page (the ndjson export layout, see
+    exports.table_lines()) and a last line with the job's status and the
+    extraction response or error.
+
+    stream() polls the report's Page rows every EXTRACTION_EVENTS_POLL
+    seconds with the events stream's poller (page_events.poll_pages()). A
+    finished page is sent as soon as its Page row is written, its tables are
+    stored by then: small tables inline on their Table, larger ones in the
+    canonical file named by Table.digest.
+
+    Pages finish out of order. With order=page the pages go through a
+    reorder buffer (ordered()) that holds pages finished ahead of the next
+    page in the range. When more than EXTRACTION_STREAM_REORDER pages are
+    waiting the buffer stops waiting for the missing page, which is sent
+    whenever it finishes.
+
+    The stream ends EXTRACTION_STREAM_TIMEOUT seconds after the upload
+    whether or not the job is finished, its last line then has the job's
+    current status and the job can be followed at api/jobs/{id}/. Pages
+    dropped after being sent (failed writes) are listed under 'write errors'
+    in the job's result.
+
+Returns:
+    [generator]: [ndjson bytes]
+"""
+
+import json
+import itertools
+
+import pandas as pd
+
+from api.models import Report, Table, Job
+from api.scripts import exports, table_store, page_events
+
+
+# default pages held waiting for a missing page, order=page
+REORDER = 32
+
+# default seconds between polls of the report's pages
+POLL = page_events.POLL
+
+# Page fields read each poll
+PAGE_FIELDS = ("page_num", "status", "updated")
+
+# default seconds before the stream ends, None for no limit
+TIMEOUT = 3600
+
+
+def ordered(results, first_page: int, window=REORDER):
+    """
+    page results in page order, through a reorder buffer of at most window
+    pages finished ahead of the next page
+
+    Args:
+        results (iterable):     [page results in completion order]
+        first_page (int):       [first page of the job's range]
+        window (int, optional): [pages held before the missing page is given
+                                 up on]. Defaults to REORDER.
+
+    Yields:
+        dict: [page results]
+    """
+    buffered = {}
+    expected = first_page
+
+    for result in results:
+        page = result["page"]
+
+        # a page given up on earlier, sent as it arrives
+        if page < expected:
+            yield result
+            continue
+
+        buffered[page] = result
+
+        while buffered:
+            if expected in buffered:
+                yield buffered.pop(expected)
+                expected += 1
+            elif len(buffered) > window:
+                expected = min(buffered)
+            else:
+                break
+
+    # pages never finished (stopped at the job budget) leave gaps
+    for page in sorted(buffered):
+        yield buffered[page]
+
+
+def line(data: dict) -> bytes:
+    """
+    one ndjson line
+    """
+    return (json.dumps(data) + "\n").encode("utf-8")
+
+
+def page_results(report_id: int, pages: dict) -> list:
+    """
+    tables of finished pages, pages whose stored tables are missing are
+    left out
+
+    Args:
+        report_id (int):    [Report id]
+        pages (dict):       [page number: status]
+
+    Returns:
+        list: [{"page": page number, "tables": exports.table_lines() entries}]
+    """
+    tables = {}
+    for table in Table.objects.filter(
+        report_id=report_id,
+        page_num__in=[num for num, status in pages.items() if status == "ok"],
+        table_num__isnull=False,
+    ):
+        tables.setdefault(table.page_num, []).append(table)
+
+    results = []
+    for num in pages:
+        entries = []
+        for table in tables.get(num, []):
+            # a page's tables are stored before its Page row is written
+            if table.cells is not None:
+                df = pd.DataFrame(table.cells)
+            elif table.digest is not None:
+                try:
+                    df = table_store.read(table_store.canonical_path(table.digest))
+                except FileNotFoundError:
+                    break
+            else:
+                break
+
+            entries.append(
+                {
+                    "table": table.table_num,
+                    "region": [table.x1, table.y1, table.x2, table.y2],
+                    "parsing_report": table.parsing_report,
+                    "df": df,
+                }
+            )
+        else:
+            results.append({"page": num, "tables": entries})
+
+    return results
+
+
+def tail(job_id: int, report_id: int, poll=POLL, timeout=TIMEOUT):
+    """
+    page results of a job's report as its pages finish, until the job is
+    finished or the timeout
+
+    Yields:
+        dict: [page_results() entries]
+    """
+    sent = set()
+
+    for changed, _ in page_events.poll_pages(
+        report_id, PAGE_FIELDS, job_id, poll, timeout, None
+    ):
+        # pages are sent once, a page written again (re-parsed) is not
+        pages = {
+            page["page_num"]: page["status"]
+            for page in changed
+            if page["page_num"] not in sent
+        }
+
+        for result in page_results(report_id, pages) if pages else []:
+            sent.add(result["page"])
+            yield result
+
+
+def stream(job: Job, order=None, window=REORDER, poll=POLL, timeout=TIMEOUT):
+    """
+    ndjson lines of a queued job's tables as its pages finish
+
+    Args:
+        job (Job):                  [queued job]
+        order (str, optional):      ['page' to keep page order]. Defaults to None.
+        window (int, optional):     [reorder buffer pages]. Defaults to REORDER.
+        poll (float, optional):     [seconds between polls]. Defaults to POLL.
+        timeout (float, optional):  [seconds before the stream ends]. Defaults to TIMEOUT.
+
+    Yields:
+        bytes: [ndjson lines]
+    """
+    yield line({"job id": job.pk, "report id": job.report_id, "status": job.status})
+
+    pages = tail(job.pk, job.report_id, poll, timeout)
+    if order == "page":
+        first = next(pages, None)
+        if first is not None:
+            # the range is checked and saved on the report before any page runs
+            start_page = Report.objects.values_list("start_page", flat=True).get(pk=job.report_id)
+            pages = ordered(itertools.chain([first], pages), start_page, window)
+
+    for result in pages:
+        for table in exports.table_lines(result["page"], result["tables"]):
+            yield table.encode("utf-8")
+
+    job = Job.objects.get(pk=job.pk)
+    yield line(
+        {
+            "job id": job.pk,
+            "status": job.status,
+            "result": job.result,
+            "error": job.error,
+        }
+    )
@@ -0,0 +1,192 @@
+"""
+text_detector.py
+    version: 1.0
+
+Logic:
+    Neural network free table detector for born-digital pages, sits in the
+    same slot as YOLOV3 detectTable() but works straight from the glyph boxes
+    of the pdf text layer, no rasterisation or inferencing.
+
+    Glyphs are grouped into text rows and segments (stream_parser), then:
+
+        1. a segment is aligned when its left edge, right edge or centre
+           lines up (within ALIGN_TOL glyph heights) with a segment in the
+           row directly above or below it
+        2. a row is tabular when it holds at least MIN_COLUMNS segments and
+           at least ROW_ALIGNED of them are aligned
+        3. runs of tabular rows, bridging up to MAX_GAP other rows (spanning
+           headers, subtotals) but broken by blank space taller than
+           MAX_LEADING glyph heights, with at least MIN_ROWS rows become
+           regions
+        4. two column prose also aligns, so a region is only kept when it
+           has MIN_NUMERIC numeric segments or at least three columns
+
+    Region confidence is the share of aligned segments weighted by the share
+    of numeric segments, so it can be compared against YOLOV3 confidences.
+
+    Regions are (N, 4) float arrays of x1, y1, x2, y2 where (x1, y1) is
+    left-top and (x2, y2) is right-bottom in pdf coordinate space, the same
+    as regions.pdf_regions() output.
+
+Returns:
+    [tuple]: [(N, 4) regions, (N,) confidences]
+"""
+
+import numpy as np
+import pandas as pd
+
+from api.scripts import stream_parser, regions
+
+
+# edge alignment tolerance, as fraction of median glyph height
+ALIGN_TOL = 0.5
+
+# segments per row, share of aligned segments for a row to be tabular
+MIN_COLUMNS = 2
+ROW_ALIGNED = 0.5
+
+# tabular rows per region, other rows bridged inside a region, blank space
+# between rows that ends a region as multiple of median glyph height
+MIN_ROWS = 3
+MAX_GAP = 1
+MAX_LEADING = 3.0
+
+# share of numeric segments for two column regions
+MIN_NUMERIC = 0.3
+
+# amounts, counts, percentages, dates: digits with currency, sign and separators
+NUMERIC = r"[\s$€£¥(+\-]*\d[\d\s.,:/\-]*%?\)?(?:\s*(?:CR|DR|Cr|Dr))?"
+
+
+def numeric_segments(seg_text: np.ndarray) -> np.ndarray:
+    """
+    boolean mask of segments holding a single number, amount or date
+
+    Args:
+        seg_text (np.ndarray): [(S,) segment text]
+
+    Returns:
+        np.ndarray: [(S,) bool mask]
+    """
+    return pd.Series(seg_text, dtype=object).astype(str).str.fullmatch(NUMERIC).to_numpy(dtype=bool)
+
+
+def aligned_segments(seg_boxes: np.ndarray, seg_rows: np.ndarray, tol: float) -> np.ndarray:
+    """
+    boolean mask of segments with a left, right or centre edge lined up with
+    a segment in an adjacent row. Edges are binned by tol and encoded with
+    their row and edge kind as integer keys, so neighbours are found with
+    np.isin rather than a pairwise segment matrix
+
+    Args:
+        seg_boxes (np.ndarray): [(S, 4) segment boxes]
+        seg_rows (np.ndarray):  [(S,) segment row labels]
+        tol (float):            [alignment tolerance in pdf points]
+
+    Returns:
+        np.ndarray: [(S,) bool mask]
+    """
+    edges = np.column_stack(
+        (seg_boxes[:, 0], seg_boxes[:, 2], (seg_boxes[:, 0] + seg_boxes[:, 2]) / 2)
+    )
+    bins = np.floor(np.clip(edges, 0, None) / tol).astype(np.int64) + 1
+    n_bins = int(bins.max()) + 2
+    kind = np.arange(3)[None, :]
+
+    def keys(rows, b):
+        return ((rows[:, None] * 3 + kind) * n_bins + b).astype(np.int64)
+
+    own = keys(seg_rows, bins).ravel()
+
+    aligned = np.zeros(edges.shape, dtype=bool)
+    for d_row in (-1, 1):
+        for d_bin in (-1, 0, 1):
+            aligned |= np.isin(keys(seg_rows + d_row, bins + d_bin), own)
+
+    return aligned.any(axis=1)
+
+
+def row_runs(tabular: np.ndarray, breaks: np.ndarray, max_gap=MAX_GAP) -> list:
+    """
+    runs of tabular row labels, bridging up to max_gap other rows
+
+    Args:
+        tabular (np.ndarray):       [(R,) bool, row label is tabular]
+        breaks (np.ndarray):        [(R,) bool, blank space above the row
+                                     ends any run]
+        max_gap (int, optional):    [rows bridged]. Defaults to MAX_GAP.
+
+    Returns:
+        list: [arrays of tabular row labels, one per run]
+    """
+    idx = np.flatnonzero(tabular)
+    if len(idx) == 0:
+        return []
+
+    block = np.cumsum(breaks)[idx]
+    split = (np.diff(idx) > max_gap + 1) | (np.diff(block) > 0)
+
+    return np.split(idx, np.flatnonzero(split) + 1)
+
+
+def detect(boxes: np.ndarray, text: np.ndarray, page_size: tuple) -> tuple:
+    """
+    find table regions on a page from its glyph boxes
+
+    Args:
+        boxes (np.ndarray): [(N, 4) glyph boxes, page_glyphs() output]
+        text (np.ndarray):  [(N,) glyph text]
+        page_size (tuple):  [pdf page (W, H)]
+
+    Returns:
+        tuple: [(M, 4) regions top to bottom, (M,) confidences]
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 4)), np.empty(0)
+
+    height = np.median(boxes[:, 3] - boxes[:, 1])
+
+    rows = stream_parser.group_rows(boxes)
+    seg_boxes, seg_text, seg_rows = stream_parser.group_segments(boxes, text, rows)
+
+    aligned = aligned_segments(seg_boxes, seg_rows, ALIGN_TOL * height)
+    numeric = numeric_segments(seg_text)
+
+    n_rows = seg_rows.max() + 1
+    per_row = np.bincount(seg_rows, minlength=n_rows)
+    aligned_row = np.bincount(seg_rows, weights=aligned, minlength=n_rows)
+
+    tabular = (per_row >= MIN_COLUMNS) & (aligned_row >= ROW_ALIGNED * per_row)
+
+    # blank space between the bottom of a row and the top of the next
+    top = np.full(n_rows, -np.inf)
+    bottom = np.full(n_rows, np.inf)
+    np.maximum.at(top, seg_rows, seg_boxes[:, 3])
+    np.minimum.at(bottom, seg_rows, seg_boxes[:, 1])
+    breaks = np.concatenate(([False], bottom[:-1] - top[1:] > MAX_LEADING * height))
+
+    found = []
+    scores = []
+    for run in row_runs(tabular, breaks):
+        if len(run) < MIN_ROWS:
+            continue
+
+        in_run = (seg_rows >= run[0]) & (seg_rows <= run[-1])
+        numeric_share = numeric[in_run].mean()
+        n_cols = np.bincount(per_row[run]).argmax()
+
+        if numeric_share < MIN_NUMERIC and n_cols < 3:
+            continue
+
+        b = seg_boxes[in_run]
+        found.append([b[:, 0].min(), b[:, 3].max(), b[:, 2].max(), b[:, 1].min()])
+        scores.append(aligned[in_run].mean() * (0.5 + 0.5 * numeric_share))
+
+    if not found:
+        return np.empty((0, 4)), np.empty(0)
+
+    # pad by half a glyph height so edge glyph centres sit well inside
+    pad = height / 2
+    found = np.array(found) + np.array([-pad, pad, pad, -pad])
+
+    return regions.postprocess(found, page_size, scores=np.array(scores))
@@ -0,0 +1,174 @@
+"""
+worker_pool.py
+    version: 1.0
+
+Logic:
+    One warm extraction worker pool per application process, started on the
+    first job and shared by every job after it, instead of forking a new
+    mp.Pool (and loading the detection models again in every worker) for
+    each extraction.
+
+    Jobs take the pool with job(), one job at a time: a job already spreads
+    its pages over every worker, so running jobs one after another keeps the
+    host at EXTRACTION_POOL_SIZE processes however many uploads arrive.
+    Pages of a job are confirmed on the pool's written queue by the workers'
+    write behind threads (see write_behind.py).
+
+    Before a job is handed the pool it is health checked: the pool must be
+    running, every worker alive and a ping task answered within
+    EXTRACTION_POOL_PING seconds, otherwise it is restarted. Jobs restart it
+    themselves (restart()) when pages had to be stopped or their writes were
+    not confirmed, so no stopped page or stale confirmation reaches the next
+    job.
+
+Returns:
+    [WorkerPool]: [the shared pool of this process]
+"""
+
+import os
+import atexit
+import threading
+import multiprocessing as mp
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from api.scripts import write_behind
+from api.scripts.logging import Logging
+
+
+# default seconds a healthy pool takes to answer a ping
+PING_TIMEOUT = 10
+
+# pool of this process, one job holds it at a time
+_shared = None
+_lock = threading.Lock()
+
+
+class WorkerPool:
+    """
+    worker processes and the written queue their write behind threads
+    confirm pages on
+    """
+
+    def __init__(self, size: int, write_queue: int):
+        self.size = size
+        self.write_queue = write_queue
+        self.written = mp.Queue()
+
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+
+        self.pool = mp.Pool(
+            size, initializer=write_behind.start, initargs=(self.written, write_queue)
+        )
+
+    def healthy(self, timeout=PING_TIMEOUT) -> bool:
+        """
+        pool running, every worker alive and a ping task answered in time
+        """
+        if self.pool._state != "RUN":
+            return False
+
+        if any(not p.is_alive() for p in self.pool._pool):
+            return False
+
+        try:
+            self.pool.apply_async(os.getpid).get(timeout)
+        except Exception:
+            return False
+
+        return True
+
+    def close(self) -> None:
+        """
+        stop the workers, pages still running are dropped
+        """
+        self.pool.terminate()
+        self.pool.join()
+        self.written.close()
+
+        return None
+
+
+def settings_size() -> tuple:
+    """
+    configured (workers, write behind queue size) of the pool
+    """
+    size = getattr(settings, "EXTRACTION_POOL_SIZE", None) or mp.cpu_count()
+    write_queue = getattr(settings, "EXTRACTION_WRITE_BEHIND", write_behind.QUEUE_SIZE)
+
+    return size, write_queue
+
+
+def start() -> WorkerPool:
+    """
+    start the shared pool of this process
+    """
+    global _shared
+
+    size, write_queue = settings_size()
+    _shared = WorkerPool(size, write_queue)
+
+    Logging().output("INFO", f"worker pool started, {size} processes")
+
+    return _shared
+
+
+def restart(reason: str) -> WorkerPool:
+    """
+    replace the shared pool with a new one
+
+    Args:
+        reason (str): [logged restart reason]
+
+    Returns:
+        WorkerPool: [new pool]
+    """
+    Logging().output("WARNING", f"restarting worker pool: {reason}")
+
+    if _shared is not None:
+        _shared.close()
+
+    return start()
+
+
+def shutdown() -> None:
+    """
+    stop the shared pool, the next job starts a new one
+    """
+    global _shared
+
+    with _lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
+
+    return None
+
+
+# the pool lives as long as the application process, stop its workers before
+# the interpreter tears down the modules they are stopped with
+atexit.register(shutdown)
+
+
+@contextmanager
+def job():
+    """
+    hold the shared pool for one job, started or restarted first when it is
+    missing or fails its health check
+
+    Yields:
+        WorkerPool: [healthy pool, call restart() for a new one mid job]
+    """
+    with _lock:
+        timeout = getattr(settings, "EXTRACTION_POOL_PING", PING_TIMEOUT)
+
+        if _shared is None:
+            start()
+        elif not _shared.healthy(timeout):
+            restart("health check failed")
+
+        yield _shared
@@ -0,0 +1,165 @@
+"""
+write_behind.py
+    version: 1.2
+
+Logic:
+    Write behind queue for the table stores of a worker process, so canonical
+    table files and database rows are written while the worker carries on
+    with the next table or page instead of waiting on a slow volume.
+
+    Every pool worker starts one background writer thread (start(), the pool
+    initializer) with a bounded task queue: submit() blocks once
+    EXTRACTION_WRITE_BEHIND writes are pending, so a worker never runs more
+    than that far ahead of the disk.
+
+    SQLite fails a transaction that reads and then writes while another
+    connection is writing, instead of waiting, so the database writes of a
+    page go through the writer too (the page's regions and tables in one
+    bulk insert, page and layout caches, page status). Where the worker
+    itself has to delete outputs (re-parses), it calls flush() first and the
+    writer is idle while it does.
+
+    The writers of the other workers still write at the same time, and SQLite
+    fails a read then write transaction (update_or_create()) at once when it
+    meets one of them instead of waiting. Such a write is rolled back whole,
+    write() runs it again after a short wait, up to LOCK_RETRIES times.
+
+    run_page() ends every page with page_done(); once the writer reaches it,
+    every write of the page has been made and the writer puts (page number,
+    error or None) on the pool's results queue. The coordinator waits for
+    these before the job ends and reports pages whose writes failed.
+
+    Without a writer (EXTRACTION_WRITE_BEHIND = 0, or outside the worker
+    pool) submit() writes straight away.
+
+Returns:
+    [tuple]: [(page number, first write error or None) per page on the results queue]
+"""
+
+import time
+import queue
+import threading
+
+from multiprocessing import util
+
+from django.db import connection, OperationalError
+
+
+# default bounded queue size, pending writes per worker
+QUEUE_SIZE = 16
+
+# attempts at a write failed on a locked database, seconds before the first retry
+LOCK_RETRIES = 5
+LOCK_WAIT = 0.05
+
+# writer of this process, set by start()
+_writer = None
+
+
+class Writer:
+    """
+    background writer thread of a worker process
+    """
+
+    def __init__(self, results, size: int):
+        self.results = results
+        self.tasks = queue.Queue(maxsize=size)
+        self.errors = {}
+
+        self.thread = threading.Thread(target=self.run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            page, func, args, kwargs = self.tasks.get()
+
+            try:
+                if func is None:
+                    # end of page marker, everything queued before it is written
+                    self.results.put((page, self.errors.pop(page, None)))
+                else:
+                    write(func, *args, **kwargs)
+            except Exception as e:
+                # the first error of a page is reported
+                self.errors.setdefault(page, f"{type(e).__name__}: {e}")
+            finally:
+                self.tasks.task_done()
+
+                if func is not None and self.tasks.empty():
+                    # idle, do not hold the database connection of this thread
+                    connection.close()
+
+
+def write(func, *args, **kwargs):
+    """
+    run a write, again while another connection holds the database lock,
+    waiting twice as long before each retry
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if "locked" not in str(e) or attempt == LOCK_RETRIES - 1:
+                raise
+
+        time.sleep(LOCK_WAIT * 2**attempt)
+
+
+def start(results, size=QUEUE_SIZE) -> None:
+    """
+    pool initializer, start the writer of a worker process
+
+    Args:
+        results (mp.Queue):     [job results queue, (page, error) per page]
+        size (int, optional):   [pending writes before submit() blocks, 0 to
+                                 write synchronously]. Defaults to QUEUE_SIZE.
+    """
+    global _writer
+
+    _writer = Writer(results, size) if size else None
+
+    # pool workers exit as soon as the pool runs out of pages, the daemon
+    # writer thread would be dropped with any writes still queued. Runs ahead
+    # of the results queue closing (exitpriority 10) so the last pages'
+    # confirmations are still sent
+    if _writer is not None:
+        util.Finalize(None, flush, exitpriority=20)
+
+    return None
+
+
+def submit(page: int, func, *args, **kwargs) -> None:
+    """
+    queue a write of a page, blocks while the queue is full
+
+    Args:
+        page (int):         [page number the write belongs to]
+        func (callable):    [write to run on the writer thread]
+        args, kwargs:       [func arguments]
+    """
+    if _writer is None:
+        write(func, *args, **kwargs)
+    else:
+        _writer.tasks.put((page, func, args, kwargs))
+
+    return None
+
+
+def page_done(page: int) -> None:
+    """
+    mark the end of a page's writes, reported on the results queue once written
+    """
+    if _writer is not None:
+        _writer.tasks.put((page, None, (), {}))
+
+    return None
+
+
+def flush() -> None:
+    """
+    wait until every queued write of this process is made
+    """
+    if _writer is not None:
+        _writer.tasks.join()
+
+    return None
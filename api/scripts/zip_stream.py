@@ -0,0 +1,237 @@
+"""
+zip_stream.py
+    version: 1.1
+
+Logic:
+    Builds a report's csv zip on the fly when it is downloaded, instead of
+    shutil.make_archive() compressing the whole csv directory at the end of
+    every extraction.
+
+    The zip is written by hand as a stream of byte chunks: for each member a
+    local file header and its raw deflate data, then the central directory.
+    Deflated members are cached under <report dir>/.zipcache together with
+    their crc32 and sizes, so later downloads only copy bytes. A cached
+    member is used while it is newer than its source file, and the whole
+    cache of a report is dropped by invalidate() whenever the report or its
+    extractions change (see api/signals.py).
+
+Returns:
+    [generator]: [zip file bytes]
+"""
+
+import os
+import gzip
+import time
+import shutil
+import struct
+import zlib
+
+from pathlib import Path, PurePath
+
+from api.scripts import table_store
+
+
+CACHE_DIR = ".zipcache"
+
+# bytes read from disk per chunk
+CHUNK_SIZE = 64 * 1024
+
+# general purpose flag bit 11, member names are utf-8
+UTF8_FLAG = 0x800
+
+
+def cache_dir(report_db) -> Path:
+    """
+    deflated member cache directory of a report
+    """
+    return Path(report_db.document.path).parent / CACHE_DIR
+
+
+def invalidate(report_db) -> None:
+    """
+    drop every cached member of a report
+    """
+    if report_db.document:
+        shutil.rmtree(cache_dir(report_db), ignore_errors=True)
+
+    return None
+
+
+def dos_datetime(mtime: float) -> tuple:
+    """
+    file modification time as zip (dos) time and date fields
+    """
+    t = time.localtime(mtime)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+    return dos_time, dos_date
+
+
+def deflated_member(source: Path, cache: Path) -> Path:
+    """
+    raw deflate a member file into the cache, unless a cached copy newer
+    than the source exists. Cached files hold a crc32, uncompressed size,
+    compressed size header followed by the deflate data. Sources stored gzip
+    compressed are deflated from their decompressed bytes
+
+    Args:
+        source (Path):  [member file]
+        cache (Path):   [report cache directory]
+
+    Returns:
+        Path: [cached deflated member]
+    """
+    cached = cache / (source.name + ".deflate")
+
+    if cached.exists() and cached.stat().st_mtime >= source.stat().st_mtime:
+        return cached
+
+    cache.mkdir(exist_ok=True)
+
+    crc = 0
+    size = 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+
+    # write beside the final name so concurrent downloads never read a partial file
+    partial = table_store.partial_path(cached)
+    opener = gzip.open if source.suffix == table_store.GZIP_SUFFIX else open
+    with opener(source, "rb") as src, open(partial, "wb") as dst:
+        dst.write(struct.pack("<III", 0, 0, 0))
+        while True:
+            block = src.read(CHUNK_SIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            dst.write(compressor.compress(block))
+        dst.write(compressor.flush())
+
+        compressed = dst.tell() - 12
+        dst.seek(0)
+        dst.write(struct.pack("<III", crc, size, compressed))
+
+    os.replace(partial, cached)
+
+    return cached
+
+
+def stream(members, cache: Path):
+    """
+    zip file of members as a stream of byte chunks
+
+    Args:
+        members (iterable): [(name in zip, source file Path) pairs]
+        cache (Path):   [report cache directory]
+
+    Yields:
+        bytes: [zip file chunks]
+    """
+    offset = 0
+    central = []
+
+    for name, source in members:
+        cached = deflated_member(source, cache)
+        dos_time, dos_date = dos_datetime(source.stat().st_mtime)
+        encoded = name.encode("utf-8")
+
+        with open(cached, "rb") as f:
+            crc, size, compressed = struct.unpack("<III", f.read(12))
+
+            header = struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                20,
+                UTF8_FLAG,
+                8,
+                dos_time,
+                dos_date,
+                crc,
+                compressed,
+                size,
+                len(encoded),
+                0,
+            )
+            yield header + encoded
+
+            central.append(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014B50,
+                    20,
+                    20,
+                    UTF8_FLAG,
+                    8,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    compressed,
+                    size,
+                    len(encoded),
+                    0,
+                    0,
+                    0,
+                    0,
+                    0,
+                    offset,
+                )
+                + encoded
+            )
+            offset += len(header) + len(encoded) + compressed
+
+            while True:
+                block = f.read(CHUNK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    directory = b"".join(central)
+    yield directory
+    yield struct.pack(
+        "<IHHHHIIH",
+        0x06054B50,
+        0,
+        0,
+        len(central),
+        len(central),
+        len(directory),
+        offset,
+        0,
+    )
+
+
+def report_members(report_db, f_type="csv"):
+    """
+    exported files of a report as zip members, in page and table order. A
+    generator: each output file is generated as stream() reaches its member,
+    after the response has started
+
+    Args:
+        report_db (Report):         [report database object]
+        f_type (str, optional):     [Extracted.f_type to include]. Defaults to "csv".
+
+    Yields:
+        tuple: [(name in zip, source file Path), missing tables skipped]
+    """
+    extracted_list = (
+        report_db.extracted.filter(f_type=f_type)
+        .select_related("table")
+        .order_by("page_num", "table_num")
+    )
+
+    for extracted in extracted_list.iterator():
+        # output files are generated from the canonical tables on first use
+        try:
+            source = table_store.materialize(extracted)
+        except FileNotFoundError:
+            continue
+        # blob files are named by digest, members by document, page and table
+        name = f"{Path(report_db.document.name).stem}-{extracted.page_num}-table-{extracted.table_num}.{f_type}"
+        yield str(PurePath(f_type, name)), source
+
+
+def zip_name(report_db, f_type="csv") -> str:
+    """
+    download file name of a report's zip, as make_archive used to name it
+    """
+    return Path(report_db.document.name).stem + "-" + f_type.upper() + ".zip"
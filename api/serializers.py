@@ -15,8 +15,45 @@ Referenced by:
     views.py
 """
 
+from pathlib import PurePosixPath
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import *
+from api.scripts import exports
+
+
+def validate_export_types(value):
+    """
+    checks a comma separated Report.exports value against Report.EXPORT_CHOICES
+    """
+    unknown = [
+        e.strip()
+        for e in value.split(",")
+        if e.strip() and e.strip() not in dict(Report.EXPORT_CHOICES)
+    ]
+    if unknown:
+        raise serializers.ValidationError(
+            f"unknown exports {unknown}, choose from: {list(dict(Report.EXPORT_CHOICES))}"
+        )
+
+    return value
+
+
+def parquet_files(report, request) -> list:
+    """
+    urls of the part files of a report's parquet dataset, in page order,
+    from the pages recorded when the dataset was written
+    """
+    if not report.parquet:
+        return []
+
+    urls = [
+        settings.MEDIA_URL + str(PurePosixPath(report.parquet, exports.part_name(page)))
+        for page in report.parquet_pages
+    ]
+
+    return [request.build_absolute_uri(url) if request else url for url in urls]
 
 
 class ExtractedSerializer(serializers.HyperlinkedModelSerializer):
@@ -37,11 +74,17 @@ class ReportSerializer2(serializers.ModelSerializer):
     Report Model Serializer 2
     """
 
+    # csv zip download, built on request
+    zip_csv = serializers.HyperlinkedIdentityField(view_name="report-download")
+
     # link Report to it's connected Extracted model
     extracted = serializers.SlugRelatedField(
         many=True, read_only=True, slug_field="file"
     )  # send raw json
 
+    # parquet dataset, one part file url per page with tables
+    parquet = serializers.SerializerMethodField()
+
     class Meta:
         model = Report
         fields = (
@@ -50,11 +93,31 @@ class ReportSerializer2(serializers.ModelSerializer):
             "f_type",
             "document",
             "zip_csv",
+            "ndjson",
+            "xlsx",
+            "parquet",
             "total_pages",
             "start_page",
             "end_page",
+            "parser",
+            "detector",
+            "exports",
+            "tables_found",
+            "pages_with_tables",
+            "pages_processed",
+            "processing_seconds",
             "extracted",
         )
+        read_only_fields = (
+            "tables_found",
+            "pages_with_tables",
+            "pages_processed",
+            "processing_seconds",
+        )
+        extra_kwargs = {"exports": {"validators": [validate_export_types]}}
+
+    def get_parquet(self, report) -> list:
+        return parquet_files(report, self.context.get("request"))
 
 
 class ExtractedSerializer2(serializers.HyperlinkedModelSerializer):
@@ -72,9 +135,15 @@ class ReportSerializer(serializers.ModelSerializer):
     Report Model Serializer
     """
 
+    # csv zip download, built on request
+    zip_csv = serializers.HyperlinkedIdentityField(view_name="report-download")
+
     # link Report to it's connected Extracted model
     extracted = ExtractedSerializer2(read_only=True, many=True)
 
+    # parquet dataset, one part file url per page with tables
+    parquet = serializers.SerializerMethodField()
+
     class Meta:
         model = Report
         fields = (
@@ -83,8 +152,120 @@ class ReportSerializer(serializers.ModelSerializer):
             "f_type",
             "document",
             "zip_csv",
+            "ndjson",
+            "xlsx",
+            "parquet",
             "total_pages",
             "start_page",
             "end_page",
+            "parser",
+            "detector",
+            "exports",
+            "tables_found",
+            "pages_with_tables",
+            "pages_processed",
+            "processing_seconds",
             "extracted",
         )
+        read_only_fields = (
+            "tables_found",
+            "pages_with_tables",
+            "pages_processed",
+            "processing_seconds",
+        )
+        extra_kwargs = {"exports": {"validators": [validate_export_types]}}
+
+    def get_parquet(self, report) -> list:
+        return parquet_files(report, self.context.get("request"))
+
+
+class PageSerializer(serializers.ModelSerializer):
+    """
+    Page Model Serializer
+    """
+
+    class Meta:
+        model = Page
+        fields = (
+            "id",
+            "report",
+            "page_num",
+            "status",
+            "detector",
+            "tables",
+            "seconds",
+            "timings",
+            "updated",
+        )
+
+
+class TableSerializer(serializers.ModelSerializer):
+    """
+    Table Model Serializer, detected table region and parsing metadata
+    """
+
+    class Meta:
+        model = Table
+        fields = (
+            "id",
+            "report",
+            "page_num",
+            "table_num",
+            "x1",
+            "y1",
+            "x2",
+            "y2",
+            "confidence",
+            "parser",
+            "parsing_report",
+        )
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """
+    Job Model Serializer, queued extraction state and page progress
+    """
+
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            "id",
+            "report",
+            "kind",
+            "parser",
+            "status",
+            "created",
+            "started",
+            "finished",
+            "heartbeat",
+            "attempts",
+            "worker",
+            "progress",
+            "error",
+            "result",
+        )
+
+    def get_progress(self, job) -> dict:
+        """
+        pages of the report's range and pages finished so far, the range is
+        known once the worker has checked the report's pages
+        """
+        report = job.report
+        if report is None or job.status == "queued":
+            return None
+
+        total = None
+        if report.total_pages:
+            total = report.end_page - report.start_page + 1
+
+        if job.status == "done":
+            done = report.pages_processed
+        else:
+            # annotated by JobViewSet, counted here for other querysets
+            done = getattr(job, "pages_done", None)
+            if done is None:
+                done = report.pages.count()
+
+        return {"pages_total": total, "pages_done": done}
@@ -0,0 +1,119 @@
+"""
+signals.py
+    version: 1.2
+
+Logic:
+    Drops a report's cached zip members whenever the report or any of its
+    extractions change, so the next download is rebuilt from current files,
+    and releases the blob store reference of every deleted extraction.
+
+    Deleting a report releases the references of all its extractions in a
+    few aggregated queries before the cascade, the cascade's per extraction
+    handlers then skip the report's extractions. delete_extracted() does the
+    same for a subset of a report's extractions (a re-parsed page), and drops
+    the report's zip members once.
+
+Calls on:
+    models.py
+    scripts/zip_stream.py
+    scripts/blob_store.py
+
+Referenced by:
+    apps.py
+"""
+
+import threading
+
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Report, Extracted
+from api.scripts import zip_stream, blob_store
+
+
+# ids of the reports whose extractions this thread deletes in bulk
+deleting = threading.local()
+
+
+def deleting_reports() -> set:
+    """
+    reports being deleted by the current thread, or having extractions
+    deleted by delete_extracted()
+    """
+    if not hasattr(deleting, "reports"):
+        deleting.reports = set()
+
+    return deleting.reports
+
+
+def delete_extracted(report_db, extracted) -> int:
+    """
+    delete extractions of a report, releasing their blob references in a few
+    aggregated queries and dropping the report's zip members once instead of
+    per extraction
+
+    Args:
+        report_db (Report):     [report database object]
+        extracted (QuerySet):   [Extracted instances of the report]
+
+    Returns:
+        int: [Extracted instances deleted]
+    """
+    reports = deleting_reports()
+    nested = report_db.pk in reports
+
+    refs = blob_store.references(extracted)
+
+    reports.add(report_db.pk)
+    try:
+        deleted, _ = extracted.delete()
+    finally:
+        if not nested:
+            reports.discard(report_db.pk)
+
+    blob_store.release(refs)
+    zip_stream.invalidate(report_db)
+
+    return deleted
+
+
+@receiver(pre_delete, sender=Report)
+def report_deleting(sender, instance, **kwargs):
+    deleting_reports().add(instance.pk)
+    blob_store.release(blob_store.references(Extracted.objects.filter(report=instance)))
+
+
+@receiver([post_save, post_delete], sender=Report)
+def report_changed(sender, instance, **kwargs):
+    zip_stream.invalidate(instance)
+
+
+@receiver(post_delete, sender=Report)
+def report_deleted(sender, instance, **kwargs):
+    deleting_reports().discard(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Extracted)
+def extracted_changed(sender, instance, **kwargs):
+    # the report's cache is dropped once when the report goes
+    if instance.report_id in deleting_reports():
+        return
+
+    # extractions are deleted ahead of their report on cascades
+    if Extracted.report.is_cached(instance):
+        report = instance.report
+    else:
+        report = Report.objects.filter(pk=instance.report_id).first()
+
+    if report is not None:
+        zip_stream.invalidate(report)
+
+
+@receiver(post_delete, sender=Extracted)
+def extracted_deleted(sender, instance, **kwargs):
+    # released by report_deleting()
+    if instance.report_id in deleting_reports():
+        return
+
+    if instance.blob_id is not None:
+        blob_store.release({instance.blob_id: 1})
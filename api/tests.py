@@ -0,0 +1,92 @@
+"""
+tests.py
+    version: 1.0
+
+Logic:
+    API regression tests, run after the migrations are made (see README):
+
+        python manage.py test api
+
+    List endpoints fetch their related rows up front, the number of queries
+    of a list page stays the same as reports and extractions grow.
+
+Returns:
+    [None]
+"""
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Report, Extracted
+
+
+class ListQueryCountTest(TestCase):
+    """
+    queries per list page, with N and then 3N reports of a few extractions
+    """
+
+    REPORTS = 5
+    TABLES = 3
+
+    def add_reports(self, count: int) -> None:
+        """
+        add count reports with TABLES extractions each
+        """
+        start = Report.objects.count()
+
+        for i in range(start, start + count):
+            report = Report.objects.create(
+                name=f"report_{i}", document=f"report_{i}/report_{i}.pdf", f_type="pdf"
+            )
+            Extracted.objects.bulk_create(
+                [
+                    Extracted(
+                        report=report,
+                        page_num=1,
+                        table_num=t,
+                        f_type=".csv",
+                        file=f"report_{i}/csv/report_{i}_page_1_table_{t}.csv",
+                    )
+                    for t in range(self.TABLES)
+                ]
+            )
+
+    def list_queries(self, url: str) -> int:
+        """
+        queries made listing url, every listed row is on the page
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["next"])
+
+        return len(queries)
+
+    def assert_constant(self, url: str):
+        """
+        same number of queries listing url with N and 3N reports
+        """
+        self.add_reports(self.REPORTS)
+        queries = self.list_queries(url)
+
+        self.add_reports(2 * self.REPORTS)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+
+        return response
+
+    def test_reports(self):
+        response = self.assert_constant("/api/reports/")
+
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3 * self.REPORTS)
+        self.assertEqual(len(results[-1]["extracted"]), self.TABLES)
+
+    def test_extracted(self):
+        response = self.assert_constant("/api/extracted/")
+
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3 * self.REPORTS * self.TABLES)
+        self.assertEqual(results[-1]["report"], str(Report.objects.last()))
@@ -24,6 +24,9 @@ from django.conf import settings
 router = routers.DefaultRouter()
 router.register(r"reports", views.ReportViewSet)
 router.register(r"extracted", views.ExtractedViewSet)
+router.register(r"pages", views.PageViewSet)
+router.register(r"tables", views.TableViewSet)
+router.register(r"jobs", views.JobViewSet)
 
 # setup url paths for user defines routes
 urlpatterns = [
@@ -21,25 +21,60 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import viewsets
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.reverse import reverse
+from rest_framework.pagination import CursorPagination
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse, Http404
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.static import serve
 from django.conf import settings
+from django.db.models import Count
 
 from .serializers import *
-from .models import Extracted, Report
-from api.scripts import table_extract
+from .models import Extracted, Report, Page, Table, Job
+from api.scripts import zip_stream, table_store, page_events, table_stream
 from api.scripts.logging import Logging
 
-from pathlib import Path, PurePath
+from pathlib import Path
 import datetime as date
+import mimetypes
+import gzip
+import json
 
 # processing time
-from timeit import default_timer as timer
-from humanfriendly import format_timespan
 
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import JSONRenderer, BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    lets clients asking for text/event-stream (EventSource) through content
+    negotiation, the events themselves are streamed by the view
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # error responses, eg. report not found
+        return json.dumps(data).encode("utf-8")
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    cursor pagination in id order, pages stay stable while reports and
+    extractions are added. API_PAGE_SIZE results per page, or ?page_size=
+    """
+
+    page_size = getattr(settings, "API_PAGE_SIZE", 100)
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "id"
 
 
 class ReportViewSet(viewsets.ModelViewSet):
@@ -47,43 +82,234 @@ class ReportViewSet(viewsets.ModelViewSet):
     serializer based viewset for Report model [WORKING]
 
     Upload and Extract a report:    POST    api/upload/
-    List all reports:               GET     api/reports/
+    List all reports:               GET     api/reports/?cursor=&page_size=
     Retrieve report by id:          GET     api/reports/{id}/
     Retrieve report by name:        GET     api/reports/?name=
     Update existing report:         PUT     api/reports/{id}/
     Update part of report:          PATCH   api/reports/{id}/
     Remove report by id:            DELETE  api/reports/{id}/
     Remove report by name:          DELETE  api/reports/?name=
+    Re-parse stored detections:     POST    api/reports/{id}/reparse/
+    Download csv zip:               GET     api/reports/{id}/download/
+    Extraction progress events:     GET     api/reports/{id}/events/
     """
 
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
+    pagination_class = IdCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["id", "name"]  # test set attributes to filter by
 
+    def get_queryset(self):
+        # nested extractions of a page of reports in one query
+        if self.action in ("list", "retrieve"):
+            return super().get_queryset().prefetch_related("extracted")
+        return super().get_queryset()
+
+    @action(detail=True, methods=["post"])
+    def reparse(self, request, pk=None):
+        """
+        queue a re-run of only the parsing stage on the report's stored
+        detections, optional 'parser' request field, defaults to the report's
+        parser
+        """
+        report = self.get_object()
+        parser = request.data.get("parser", report.parser)
+
+        # create log object
+        log = Logging()
+
+        if parser not in dict(Report.PARSER_CHOICES):
+            error_msg = f"parser {parser} not available, choose from: {list(dict(Report.PARSER_CHOICES))}"
+            return Response(error_msg, status=status.HTTP_400_BAD_REQUEST)
+
+        # one job per report at a time, a re-parse replaces the tables an
+        # extraction is still writing
+        active = Job.objects.filter(report=report, status__in=("queued", "running")).first()
+        if active is not None:
+            return Response(
+                {
+                    "error": f"report {report.pk} already has a {active.status} job",
+                    "job id": active.pk,
+                    "job": reverse("job-detail", args=[active.pk], request=request),
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        # queue the re-parse, run by the extraction worker
+        job = Job.objects.create(report=report, kind="reparse", parser=parser)
+        log.output("INFO", f"queued re-parse job {job.pk}")
+
+        return Response(
+            {
+                "job id": job.pk,
+                "report id": report.pk,
+                "status": job.status,
+                "job": reverse("job-detail", args=[job.pk], request=request),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """
+        stream the report's csv exports as a zip, built on the fly from the
+        cached deflated members
+        """
+        report = self.get_object()
+
+        members = zip_stream.report_members(report)
+        response = StreamingHttpResponse(
+            zip_stream.stream(members, zip_stream.cache_dir(report)),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{zip_stream.zip_name(report)}"'
+        )
+
+        return response
+
+    @action(detail=True, methods=["get"], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def events(self, request, pk=None):
+        """
+        stream the report's extraction progress as server-sent events, one
+        'page' event per finished page, until its queued extraction is done
+        """
+        report = self.get_object()
+
+        response = StreamingHttpResponse(
+            page_events.stream(
+                report.pk,
+                getattr(settings, "EXTRACTION_EVENTS_POLL", page_events.POLL),
+                getattr(settings, "EXTRACTION_EVENTS_TIMEOUT", page_events.TIMEOUT),
+                getattr(settings, "EXTRACTION_EVENTS_IDLE", page_events.IDLE),
+            ),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # proxies must pass events on as they are sent
+        response["X-Accel-Buffering"] = "no"
+
+        return response
+
 
 class ExtractedViewSet(viewsets.ModelViewSet):
     """
     serializer based viewset for Extracted model [WORKING]
 
-    List all extractions:           GET     api/extracted/
+    List all extractions:           GET     api/extracted/?cursor=&page_size=
     Retrieve extraction by id:      GET     api/extracted/{id}/
     Update existing extraction:     PUT     api/extracted/{id}/
     Update part of extraction:      PATCH   api/extracted/{id}/
     Remove extraction by id:        DELETE  api/extracted/{id}/
     Remove extraction by name:      DELETE  api/extracted/?name=
+    Table cells or a slice:         GET     api/extracted/{id}/cells/?rows=a:b&cols=c:d
     """
 
     queryset = Extracted.objects.all()
     serializer_class = ExtractedSerializer
+    pagination_class = IdCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["id", "f_type"]  # test set attributes to filter by
 
+    def get_queryset(self):
+        # the table, and with it any inline cells, in the same query
+        if self.action == "cells":
+            return super().get_queryset().select_related("table")
+        # the report named by every row in the same query
+        return super().get_queryset().select_related("report")
+
+    @action(detail=True, methods=["get"])
+    def cells(self, request, pk=None):
+        """
+        the extraction's table cells, optional 'rows' and 'cols' query
+        parameters select a slice as start:stop (python slice semantics)
+        """
+        extracted = self.get_object()
+
+        try:
+            rows = cell_slice(request.query_params.get("rows"))
+            cols = cell_slice(request.query_params.get("cols"))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            matrix = table_store.cells(extracted)
+        except FileNotFoundError as e:
+            return Response(str(e), status=status.HTTP_404_NOT_FOUND)
+
+        n_cols = len(matrix[0]) if matrix else 0
+
+        return Response(
+            {
+                "id": extracted.id,
+                "page_num": extracted.page_num,
+                "table_num": extracted.table_num,
+                "shape": [len(matrix), n_cols],
+                "rows": list(rows.indices(len(matrix))[:2]),
+                "cols": list(cols.indices(n_cols)[:2]),
+                "cells": [row[cols] for row in matrix[rows]],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class PageViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    serializer based viewset for Page model
+
+    List all processed pages:       GET     api/pages/
+    Retrieve page by id:            GET     api/pages/{id}/
+    List pages of a report:         GET     api/pages/?report=
+    """
+
+    queryset = Page.objects.all()
+    serializer_class = PageSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["report", "page_num", "status"]
+
+
+class TableViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    serializer based viewset for Table model, detections and parsing metadata
+
+    List all detected tables:       GET     api/tables/
+    Retrieve detection by id:       GET     api/tables/{id}/
+    List detections of a report:    GET     api/tables/?report=
+    """
+
+    queryset = Table.objects.all()
+    serializer_class = TableSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["report", "page_num", "table_num"]
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    serializer based viewset for Job model, queued extractions
+
+    List all jobs:                  GET     api/jobs/
+    Retrieve job state by id:       GET     api/jobs/{id}/
+    List jobs of a report:          GET     api/jobs/?report=
+    """
+
+    # pages finished so far counted in the same query, aggregated querysets
+    # do not apply Meta.ordering
+    queryset = (
+        Job.objects.select_related("report")
+        .annotate(pages_done=Count("report__pages"))
+        .order_by("created")
+    )
+    serializer_class = JobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["report", "status"]
+
 
 class UploadView(APIView):
     """
-    url based upload view with extraction function [WORKING]
-    Add a new report and extract: POST api/upload/
+    url based upload view, queues the extraction [WORKING]
+    Add a new report and queue its extraction: POST api/upload/
+    Add a new report and stream its tables:    POST api/upload/?stream=ndjson[&order=page]
     """
 
     parser_classes = (MultiPartParser, FormParser)
@@ -106,18 +332,13 @@ class UploadView(APIView):
         # uploaded file url location
         file_url = report_serializer.data["document"]
 
-        # get pages info
-        start_page = report_serializer.data["start_page"]
-        end_page = report_serializer.data["end_page"]
-
         # django upload root dir
         media_root_dir = settings.MEDIA_ROOT
 
-        # build file path name and path location
+        # build file name, the extraction reads the path from the report
         full_path = Path(file_url)
         base_dir = full_path.parts[3]
         file_name = full_path.name
-        file_path = PurePath(media_root_dir, base_dir, file_name)
 
         # get newly created Report db instance and update name and file_type fields
         r = Report.objects.get(document__endswith=file_name)
@@ -135,24 +356,138 @@ class UploadView(APIView):
 
         # log output
         log.output("INFO", "/documents cleaned")
-        log.output("INFO", "sending file for extraction...")
 
-        # start stopwatch
-        start = timer()
+        # queue the extraction, run by the extraction worker
+        # (python manage.py extraction_worker)
+        job = Job.objects.create(report=r)
+        log.output("INFO", f"queued extraction job {job.pk}")
+
+        # streamed uploads send the job's tables as its pages finish
+        if request.query_params.get("stream") == "ndjson":
+            response = StreamingHttpResponse(
+                table_stream.stream(
+                    job,
+                    request.query_params.get("order"),
+                    getattr(settings, "EXTRACTION_STREAM_REORDER", table_stream.REORDER),
+                    getattr(settings, "EXTRACTION_EVENTS_POLL", table_stream.POLL),
+                    getattr(settings, "EXTRACTION_STREAM_TIMEOUT", table_stream.TIMEOUT),
+                ),
+                content_type="application/x-ndjson",
+            )
+            response["X-Accel-Buffering"] = "no"
+
+            return response
+
+        return Response(
+            {
+                "job id": job.pk,
+                "report id": r.pk,
+                "status": job.status,
+                "job": reverse("job-detail", args=[job.pk], request=request),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        try:
-            # run extraction script, set output_type: ['json','csv','xlsx', 'all']
-            # 'all' currently only set to json, csv
-            # returns dictionary
-            extracted = table_extract.extract(file_path, start_page, end_page)
 
-        except Exception as e:
-            error_output = "".join(["Extraction script: ", str(e)])
-            log.output("ERROR", error_output)
-            return HttpResponse(error_output, status=500)  # 500 Internal Server Error
+def cell_slice(value) -> slice:
+    """
+    'start:stop' query parameter as a slice, either bound may be left out,
+    a missing parameter selects everything
+
+    Raises:
+        ValueError: [when the parameter is not start:stop integers]
+    """
+    if not value:
+        return slice(None)
+
+    bounds = value.split(":")
+    if len(bounds) != 2:
+        raise ValueError(f"slice {value} is not start:stop")
+
+    try:
+        return slice(*(int(b) if b.strip() else None for b in bounds))
+    except ValueError:
+        raise ValueError(f"slice {value} is not start:stop integers")
+
+
+def decompressed(path: Path):
+    """
+    chunks of a gzip compressed file's content, the file is closed when the
+    response closes the generator
+    """
+    with gzip.open(path, "rb") as f:
+        while True:
+            block = f.read(zip_stream.CHUNK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+def accepts_gzip(header: str) -> bool:
+    """
+    Accept-Encoding header allows gzip, with a q-value above 0 for gzip (or
+    x-gzip) or else for the * wildcard
+    """
+    q_values = {}
+    for item in header.split(","):
+        coding, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            q_values[coding.lower()] = q
+
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in q_values:
+            return q_values[coding] > 0
+
+    return False
+
+
+def media(request, path):
+    """
+    media file view [WORKING]
+    Serve an uploaded or extracted file: GET documents/{path}
+
+    table output files (csv, json, xlsx) are generated from the canonical
+    table on their first request, then served from disk. Files stored gzip
+    compressed are sent as they are to clients accepting gzip, and
+    decompressed on the fly for the rest
+    """
+    # the decompressing branch reads files without static serve's own check
+    try:
+        full_path = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404("path outside media root")
+
+    compressed = full_path.with_name(full_path.name + table_store.GZIP_SUFFIX)
+
+    if not full_path.exists() and not compressed.exists():
+        extracted = Extracted.objects.filter(file=path).select_related("table").first()
+
+        if extracted is not None:
+            try:
+                table_store.materialize(extracted)
+            except FileNotFoundError as e:
+                Logging().output("WARNING", str(e))
+
+    if full_path.exists() or not compressed.exists() or path.endswith("/"):
+        return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    if accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        # static serve sets Content-Type from the inner name, Content-Encoding: gzip
+        response = serve(request, path + table_store.GZIP_SUFFIX, document_root=settings.MEDIA_ROOT)
+    else:
+        content_type, _ = mimetypes.guess_type(full_path.name)
+        response = StreamingHttpResponse(
+            decompressed(compressed), content_type=content_type or "application/octet-stream"
+        )
 
-        # end stopwatch and log time
-        end = timer()
-        log.output("INFO", f'extraction completed in" {format_timespan(end - start)}')
+    patch_vary_headers(response, ("Accept-Encoding",))
 
-        return Response(extracted, status=status.HTTP_201_CREATED)
+    return response
@@ -137,6 +137,89 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 
+# Extraction time budgets in seconds, None for no limit
+# page: a page over budget is stopped inside its worker and marked timed out
+# job: pages still running when the job budget runs out are marked timed out
+EXTRACTION_PAGE_TIMEOUT = 120
+EXTRACTION_JOB_TIMEOUT = 1800
+
+# Detection cascade, every page is run through the tiny table model and only
+# pages with a detection confidence inside the (low, high) band are run again
+# with the full holms-ur model, needs the full model weights in YOLOV3/utils
+EXTRACTION_CASCADE = True
+EXTRACTION_CASCADE_BAND = (0.30, 0.60)
+
+# Page cache, pages with the same content and resources as a page already
+# extracted in any document return its stored tables
+EXTRACTION_PAGE_CACHE = True
+
+# Inline table cells, tables whose compact json cell matrix is at most this
+# many bytes are stored in the database instead of a canonical file, 0 to
+# always write the file
+EXTRACTION_INLINE_CELLS = 16 * 1024
+
+# Compressed outputs, csv and json table files are stored gzip compressed and
+# served with Content-Encoding: gzip, or decompressed for other clients
+EXTRACTION_COMPRESS_OUTPUTS = True
+
+# Write behind, every worker writes its tables from a background thread with
+# at most this many writes pending, 0 to write synchronously
+EXTRACTION_WRITE_BEHIND = 16
+
+# Seconds the coordinator waits for the workers to confirm the writes of a
+# job's finished pages, pages not confirmed in time are marked failed
+EXTRACTION_WRITE_TIMEOUT = 60
+
+# Extracted instances of a job are saved by the coordinator in one transaction,
+# inserted this many rows per query
+EXTRACTION_BULK_BATCH = 500
+
+# Layout template cache, pages matching the text layout of a previously
+# confirmed page skip rendering and detection and reuse its table regions,
+# off by default: every page then also has its text layout analysed
+# match: jaccard similarity of the text block occupancy grids
+# columns: share of each stored table's column starts found on the page
+EXTRACTION_LAYOUT_CACHE = False
+EXTRACTION_LAYOUT_MATCH = 0.9
+EXTRACTION_LAYOUT_COLUMNS = 0.8
+
+# Worker pool, one warm pool of this many extraction processes is shared by
+# every job of the application process, None for one per cpu core
+# ping: seconds a healthy pool takes to answer the health check run before
+# each job, the pool is restarted otherwise
+EXTRACTION_POOL_SIZE = None
+EXTRACTION_POOL_PING = 10
+
+# Extraction queue, uploads are queued as jobs and run by the extraction
+# worker (python manage.py extraction_worker), which checks for queued jobs
+# every this many seconds while idle
+EXTRACTION_QUEUE_POLL = 2
+
+# Job heartbeats, a running job's worker refreshes its heartbeat every
+# heartbeat seconds. Jobs without one for stale seconds (worker killed) are
+# requeued, or failed once claimed attempts times
+EXTRACTION_JOB_HEARTBEAT = 10
+EXTRACTION_JOB_STALE = 60
+EXTRACTION_JOB_ATTEMPTS = 2
+
+# Progress events, the report events stream checks the report's pages for
+# newly finished ones every this many seconds
+# timeout: seconds a stream stays open, idle: seconds without a finished page,
+# the stream then ends with a 'timeout' event, None for no limit
+EXTRACTION_EVENTS_POLL = 1
+EXTRACTION_EVENTS_TIMEOUT = 3600
+EXTRACTION_EVENTS_IDLE = 600
+
+# Streamed uploads (api/upload/?stream=ndjson&order=page), pages finished
+# ahead of a missing page held before the stream stops waiting for it
+# timeout: seconds before the stream ends whether or not its job is finished
+EXTRACTION_STREAM_REORDER = 32
+EXTRACTION_STREAM_TIMEOUT = 3600
+
+# API list pages, reports and extractions are listed this many per page with
+# cursor pagination ('next' and 'previous' links), ?page_size= up to 1000
+API_PAGE_SIZE = 100
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -24,15 +24,15 @@ Logic:
 
 from django.contrib import admin
 from django.urls import path
-from django.conf.urls.static import static
 from django.conf.urls import url, include
 from django.conf import settings
 
+from api.views import media
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     url(r"^api/", include("api.urls")),
+    # media files, table outputs are generated on first request
+    url(r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"), media, name="media"),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)